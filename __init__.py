@@ -1,6 +1,25 @@
 """Personal Task Manager."""
+import importlib
 
-from todo.base import TodoWindow
-from todo.select import FontSelector
-from todo.todo import TodoDeskWidget, TodoDockWidget
 from todo.version import __version__ as version
+
+# The GUI classes pull in PyQt5 and qtawesome, so they are only imported
+# on first access. This keeps the headless CLI free of Qt.
+_lazy_attributes = {
+    "TodoWindow": "todo.base",
+    "FontSelector": "todo.select",
+    "TodoDeskWidget": "todo.todo",
+    "TodoDockWidget": "todo.todo",
+}
+
+
+def __getattr__(name):
+    module = _lazy_attributes.get(name)
+    if module is None:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
@@ -1,10 +1,10 @@
 import os
-import time
+import functools
 import collections
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import todo
-import qtawesome
+from todo import icons, select
 
 
 class TodoWindow(QtWidgets.QMainWindow, object):
@@ -23,6 +23,10 @@ class TodoWindow(QtWidgets.QMainWindow, object):
         self.show_splash_screen()
 
         self.docked = None
+        self.debug_panel = None
+        QtWidgets.QShortcut(
+            QtGui.QKeySequence("Ctrl+Shift+D"), self, self.show_debug_panel
+        )
         self.desk_widget = QtWidgets.QWidget()
         self.desk_widget.widget = desk_widget
         self.dock_widget = QtWidgets.QWidget()
@@ -45,6 +49,8 @@ class TodoWindow(QtWidgets.QMainWindow, object):
 
         self.desk_widget.setLayout(desk_layout)
         self.dock_widget.setLayout(dock_layout)
+        desk_widget.status_message.connect(self.show_status_message)
+        dock_widget.status_message.connect(self.show_status_message)
 
         dock_toggle_action = QtWidgets.QAction(self.get_icon("dock"), "", self)
         dock_toggle_action.setCheckable(True)
@@ -82,6 +88,9 @@ class TodoWindow(QtWidgets.QMainWindow, object):
         self.setCentralWidget(widget)
         self.setWindowTitle(self.title)
         self.setWindowFlags(QtCore.Qt.FramelessWindowHint)
+        font = select.load_font_choice()
+        if font:
+            self.apply_font(font)
         self.desk()
         self.hide_splash_screen()
 
@@ -92,6 +101,7 @@ class TodoWindow(QtWidgets.QMainWindow, object):
             self.desk()
 
     def dock(self):
+        self.dock_widget.widget.ensure_view()
         self.desk_widget.hide()
         self.dock_widget.show()
 
@@ -117,9 +127,13 @@ class TodoWindow(QtWidgets.QMainWindow, object):
         if selector.exec_() == QtWidgets.QDialog.Accepted:
             font = selector.selected_font
             if font:
-                self.setFont(font)
-                self.desk_widget.widget.current_font = font
-                self.dock_widget.widget.current_font = font
+                self.apply_font(font)
+                select.save_font_choice(*selector.selected_font_info)
+
+    def apply_font(self, font):
+        self.setFont(font)
+        self.desk_widget.widget.current_font = font
+        self.dock_widget.widget.current_font = font
 
     def change_color(self):
         color = QtWidgets.QColorDialog.getColor()
@@ -133,20 +147,18 @@ class TodoWindow(QtWidgets.QMainWindow, object):
             self.desk_widget.widget.current_font_color = color
             self.dock_widget.widget.current_font_color = color
 
+    def show_debug_panel(self):
+        if self.debug_panel is None:
+            from todo import debug
+            self.debug_panel = debug.TodoDebugPanel(self)
+        self.debug_panel.show()
+        self.debug_panel.raise_()
+
     def get_icon(self, name, color=None):
-        iconmap = {
-            "font": "fa5s.font",
-            "color": "fa5s.palette",
-            "dock": "fa5s.anchor",
-            "close": "fa5.window-close"
-        }
-        if name not in iconmap:
-            return
-
-        if color:
-            return qtawesome.icon(iconmap[name], color=color)
-        else:
-            return qtawesome.icon(iconmap[name])
+        return icons.get_icon(name, color=color)
+
+    def show_status_message(self, message):
+        self.statusBar().showMessage(message, 10 * 1000)
 
     def show_splash_screen(self):
         self.splash_screen.show()
@@ -165,5 +177,9 @@ class TodoWindow(QtWidgets.QMainWindow, object):
         )
 
     def hide_splash_screen(self, delay=None):
-        time.sleep(delay or 0)
-        self.splash_screen.finish(self)
+        # finish() waits for the window to be exposed, so this only needs to
+        # run once the event loop is up instead of blocking construction.
+        QtCore.QTimer.singleShot(
+            int((delay or 0) * 1000),
+            functools.partial(self.splash_screen.finish, self)
+        )
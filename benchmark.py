@@ -0,0 +1,293 @@
+"""Model/view benchmarks on the offscreen Qt platform.
+
+Run with ``python -m todo.benchmark``. Every size gets a freshly generated
+database in a temporary directory, results are written as JSON and can be
+compared against an earlier run with ``--compare``.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from todo import constant, database
+from todo.version import __version__
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+ROLES = (
+    "DisplayRole",
+    "EditRole",
+    "CheckStateRole",
+    "ToolTipRole",
+    "TextAlignmentRole",
+    "FontRole",
+    "ForegroundRole",
+)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    samples = [sample * 1000 for sample in samples]
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 4),
+        "p50_ms": round(percentile(samples, 0.5), 4),
+        "p90_ms": round(percentile(samples, 0.9), 4),
+        "p99_ms": round(percentile(samples, 0.99), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def measure(function, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def wait_for(models):
+    """Handle events until the asynchronous loads of ``models`` are in."""
+    from PyQt5 import QtCore
+
+    while any(model.queries for model in models):
+        QtCore.QCoreApplication.processEvents(
+            QtCore.QEventLoop.WaitForMoreEvents
+        )
+
+
+def loaded(function, models):
+    """Wrap ``function`` so it also waits for the loads it starts."""
+    def wrapper():
+        function()
+        wait_for(models)
+    return wrapper
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def generate_database(path, size, seed=None):
+    """Fill a new database with ``size`` tasks spread over all priorities."""
+    generator = random.Random(seed)
+    connection = database.ConnectionRegistry(path).connection()
+    now = database.get_timestamp()
+    priorities = list(constant.PRIORITIES.keys())
+
+    def rows():
+        for index in range(size):
+            # Recent timestamps keep the lifespan sweeper from touching them.
+            yield (
+                int(generator.random() < 0.2),
+                "benchmark task {} {:x}".format(index, generator.getrandbits(32)),
+                now - generator.randint(0, 60 * 60),
+                generator.choice(priorities),
+            )
+
+    command = "INSERT INTO {} ({}) VALUES (?, ?, ?, ?)".format(
+        database.TABLE, ", ".join(field for field, datatype in database.FIELDS)
+    )
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= 10000:
+            with database.transaction(connection):
+                connection.executemany(command, batch)
+            batch = []
+    if batch:
+        with database.transaction(connection):
+            connection.executemany(command, batch)
+    connection.close()
+
+
+def run_size(size, directory, repeat, viewport_rows, bulk_size):
+    from PyQt5 import QtCore
+    from todo import todo as todo_module
+
+    path = os.path.join(directory, "todo-{}.db".format(size))
+    started = time.perf_counter()
+    generate_database(path, size)
+    generated = time.perf_counter() - started
+
+    registry = todo_module.TodoConnectionRegistry(path)
+    registry.connection_name = u"todo_benchmark_{}".format(size)
+    todo_module.TodoConnectionRegistry.set_instance(registry)
+
+    results = {"generate_s": round(generated, 3)}
+    models = {}
+    for priority, lifespans in constant.LIFESPANS.items():
+        # Built like TodoView builds them, so select() is timed until the
+        # rows are actually in.
+        model = todo_module.TodoModel(
+            priority,
+            lifespans,
+            paged=lifespans[0] is None,
+            async_select=constant.ASYNC_SELECT
+        )
+        model.current_font = QtCore.QCoreApplication.instance().font()
+        model.current_font_color = "black"
+        models[priority] = model
+        wait_for([model])
+        results["select:{}".format(priority)] = measure(
+            loaded(model.select, [model]), repeat
+        )
+
+    roles = [getattr(QtCore.Qt, role) for role in ROLES]
+    model = models[1]
+    cells = [
+        model.index(row, column)
+        for row in range(min(viewport_rows, model.rowCount()))
+        for column in range(model.columnCount())
+    ]
+
+    def data_sweep():
+        for index in cells:
+            for role in roles:
+                model.data(index, role)
+
+    def flags_sweep():
+        for index in cells:
+            model.flags(index)
+
+    results["data_sweep"] = measure(data_sweep, repeat)
+    results["flags_sweep"] = measure(flags_sweep, repeat)
+
+    ids = [model.id_for_row(row) for row in range(min(bulk_size, model.rowCount()))]
+    results["bulk_mark_completed"] = measure(
+        loaded(lambda: model.mark_entries(ids, True), models.values()), repeat,
+        setup=loaded(lambda: model.mark_entries(ids, False), models.values())
+    )
+    results["bulk_move"] = measure(
+        loaded(lambda: model.move_entries(ids, 2), models.values()), repeat,
+        setup=loaded(lambda: models[2].move_entries(ids, 1), models.values())
+    )
+
+    widget = todo_module.TodoDeskWidget()
+    for index in range(widget.stack.count()):
+        widget.ensure_view(index)
+    view_models = [view.model() for view in widget.views.values()]
+    wait_for(view_models)
+    results["refresh"] = measure(loaded(widget.refresh, view_models), repeat)
+
+    # Full viewport repaints go through TodoItemDelegate.
+    view = widget.current_view
+    view.resize(800, 600)
+    results["paint_viewport"] = measure(view.viewport().grab, repeat)
+
+    def add():
+        widget.current_view.model().add_entry({
+            "title": "benchmark add",
+            "timestamp": database.get_timestamp(),
+        })
+
+    all_models = list(models.values()) + view_models
+    results["add"] = measure(loaded(add, all_models), repeat)
+    results["peak_rss_kb"] = peak_rss_kb()
+
+    widget.sweeper.stop()
+    widget.deleteLater()
+    # The process wide helpers hold this size's registry, the next size
+    # gets new ones.
+    for helper in (
+            todo_module.TodoLifespanSweeper,
+            todo_module.TodoExternalChangeWatcher
+    ):
+        if helper._shared is not None:
+            helper._shared.stop()
+            helper._shared.deleteLater()
+            helper._shared = None
+    for model in models.values():
+        model.deleteLater()
+    QtCore.QCoreApplication.processEvents()
+    # Queries still running would read from a database about to be deleted.
+    todo_module.TodoQuery.pool().waitForDone()
+    registry.close()
+
+    return results
+
+
+def compare(current, baseline):
+    lines = []
+    for size, results in sorted(current["results"].items(), key=lambda item: int(item[0])):
+        previous = baseline.get("results", {}).get(size, {})
+        for name, result in sorted(results.items()):
+            if not isinstance(result, dict) or name not in previous:
+                continue
+            before = previous[name]["p50_ms"]
+            after = result["p50_ms"]
+            ratio = after / before if before else float("inf")
+            lines.append("{:>8} {:<24} {:>10.3f} -> {:>10.3f} ms  x{:.2f}".format(
+                size, name, before, after, ratio
+            ))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m todo.benchmark", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "-s", "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+        help="Database sizes to generate, e.g. 1000 10000 100000 1000000."
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    parser.add_argument("--viewport-rows", type=int, default=30)
+    parser.add_argument("--bulk-size", type=int, default=500)
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="File to write the JSON results to (default: stdout)."
+    )
+    parser.add_argument(
+        "-c", "--compare", metavar="BASELINE",
+        help="Earlier results to compare the median latencies against."
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    application = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    directory = tempfile.mkdtemp(prefix="todo-benchmark-")
+    try:
+        report = {
+            "version": __version__,
+            "python": sys.version.split()[0],
+            "platform": application.platformName(),
+            "repeat": args.repeat,
+            "results": {},
+        }
+        for size in args.sizes:
+            report["results"][str(size)] = run_size(
+                size, directory, args.repeat, args.viewport_rows, args.bulk_size
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == "-":
+        sys.stdout.write(output + "\n")
+    else:
+        with open(args.output, "w") as target:
+            target.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            sys.stderr.write(compare(report, json.load(baseline)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Headless command line interface.
+
+Only the Qt-free core is imported here, so scripted use never pays for
+PyQt5 and works without a display.
+"""
+import argparse
+import json
+import sys
+import time
+
+from todo import constant, database, transfer
+
+
+def parse_priority(value):
+    priority = transfer.get_priority(value)
+    if priority is not None:
+        return priority
+
+    raise argparse.ArgumentTypeError(
+        "invalid priority: {!r} (choose from {})".format(
+            value, ", ".join(constant.PRIORITIES.values())
+        )
+    )
+
+
+def format_timestamp(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def get_database():
+    todo_database = database.TodoDatabase()
+    # Apply the same lifespan rules as the GUI before touching anything.
+    todo_database.process_lifespans(constant.LIFESPANS)
+    return todo_database
+
+
+def add(args):
+    todo_database = get_database()
+    id = todo_database.add_entry({
+        "completed": 0,
+        "title": " ".join(args.title).strip(),
+        "timestamp": database.get_timestamp(),
+        "priority": args.priority,
+    })
+    print(id)
+
+
+def ls(args):
+    completed = None
+    if args.active:
+        completed = False
+    elif args.completed:
+        completed = True
+
+    entries = get_database().iter_entries(args.priority, completed)
+    for batch in entries:
+        for id, completed, title, timestamp, priority in batch:
+            if args.json:
+                print(json.dumps({
+                    "id": id,
+                    "completed": bool(completed),
+                    "title": title,
+                    "timestamp": timestamp,
+                    "priority": priority,
+                }))
+            else:
+                print(u"{:>6}  [{}] {}  ({}, {})".format(
+                    id,
+                    "x" if completed else " ",
+                    title,
+                    constant.PRIORITIES.get(priority, priority),
+                    format_timestamp(timestamp)
+                ))
+
+
+def done(args):
+    get_database().update_entries(args.ids, {"completed": int(not args.undo)})
+
+
+def mv(args):
+    get_database().update_entries(args.ids, {"priority": args.priority})
+
+
+def rm(args):
+    get_database().remove_many(args.ids)
+
+
+def get_format(args):
+    return args.format or transfer.guess_format(args.file)
+
+
+def import_entries(args):
+    todo_database = get_database()
+    source = (
+        sys.stdin if args.file == "-" else open(args.file, newline="")
+    )
+    with source:
+        try:
+            count = transfer.import_entries(
+                todo_database, source, get_format(args)
+            )
+        except transfer.TransferError as error:
+            sys.stderr.write("import failed, {}\n".format(error))
+            return 1
+    print(count)
+
+
+def export_entries(args):
+    target = (
+        sys.stdout if args.file == "-" else open(args.file, "w", newline="")
+    )
+    try:
+        transfer.export_entries(
+            get_database(), target, get_format(args), args.priority
+        )
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+
+def build_parser(prog=None, description=None):
+    parser = argparse.ArgumentParser(
+        prog=prog or "todo", description=description or "Personal Task Manager."
+    )
+    commands = parser.add_subparsers(title="commands", metavar="COMMAND")
+
+    command = commands.add_parser("add", help="Add a todo.")
+    command.add_argument("title", nargs="+", help="What would you like to do?")
+    command.add_argument(
+        "-p", "--priority", type=parse_priority, default=1,
+        help="Priority number or label (default: Today)."
+    )
+    command.set_defaults(func=add)
+
+    command = commands.add_parser("ls", help="List todos.")
+    command.add_argument(
+        "-p", "--priority", type=parse_priority, help="Only list one priority."
+    )
+    state = command.add_mutually_exclusive_group()
+    state.add_argument("-a", "--active", action="store_true")
+    state.add_argument("-c", "--completed", action="store_true")
+    command.add_argument(
+        "--json", action="store_true", help="Print one JSON object per line."
+    )
+    command.set_defaults(func=ls)
+
+    command = commands.add_parser("done", help="Mark todos completed.")
+    command.add_argument("ids", nargs="+", type=int, metavar="ID")
+    command.add_argument(
+        "-u", "--undo", action="store_true", help="Mark them active again."
+    )
+    command.set_defaults(func=done)
+
+    command = commands.add_parser("mv", help="Send todos to another priority.")
+    command.add_argument("ids", nargs="+", type=int, metavar="ID")
+    command.add_argument("priority", type=parse_priority)
+    command.set_defaults(func=mv)
+
+    command = commands.add_parser("rm", help="Remove todos.")
+    command.add_argument("ids", nargs="+", type=int, metavar="ID")
+    command.set_defaults(func=rm)
+
+    command = commands.add_parser(
+        "import", help="Import todos from JSONL or CSV."
+    )
+    command.add_argument("file", help="File to read, - for stdin.")
+    command.add_argument(
+        "-f", "--format", choices=transfer.FORMATS,
+        help="Input format (default: from the file extension, else jsonl)."
+    )
+    command.set_defaults(func=import_entries)
+
+    command = commands.add_parser(
+        "export", help="Export todos as JSONL or CSV."
+    )
+    command.add_argument(
+        "file", nargs="?", default="-", help="File to write, - for stdout."
+    )
+    command.add_argument(
+        "-f", "--format", choices=transfer.FORMATS,
+        help="Output format (default: from the file extension, else jsonl)."
+    )
+    command.add_argument(
+        "-p", "--priority", type=parse_priority, help="Only export one priority."
+    )
+    command.set_defaults(func=export_entries)
+
+    return parser
+
+
+def main(argv=None, parser=None):
+    parser = parser or build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 1
+    return args.func(args)
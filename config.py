@@ -1,55 +1,125 @@
+import atexit
+import contextlib
 import os
+import threading
+import weakref
 
 import bson
 
+from todo import utils
+
 
 class ConfigurationError(Exception):
     pass
 
 
+# Configurations are often created for a single call, so the exit hook is
+# registered once and flushes whichever of them are still around.
+_configurations = weakref.WeakSet()
+
+
+def flush_all():
+    for configuration in list(_configurations):
+        configuration.flush()
+
+
+atexit.register(flush_all)
+
+
 class Configuration(object):
-    def __init__(self):
+    def __init__(self, flush_delay=None):
         super(Configuration, self).__init__()
         self.__configdir__ = os.path.join(
             os.environ.get("HOME"), ".config", "todo"
         )
         self.__configfile__ = os.path.join(self.__configdir__, "todo.conf")
         self.__config__ = None
+        # Seconds to wait for further mutations before writing them out
+        # together. Zero writes every mutation straight away.
+        self.flush_delay = 0.1 if flush_delay is None else flush_delay
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._dirty = False
+        self._flush_timer = None
+        self._written = None
         self._ensure()
         self._read()
+        _configurations.add(self)
 
     def _ensure(self):
         if not os.path.isdir(self.__configdir__):
             os.makedirs(self.__configdir__, mode=0o755)
         if not os.path.isfile(self.__configfile__):
-            with open(self.__configfile__, "wb") as config:
-                config.write(bson.dumps({}))
+            utils.atomic_write(self.__configfile__, bson.dumps({}))
 
     def _read(self):
         with open(self.__configfile__, "rb") as config:
-            self.__config__ = bson.loads(config.read())
+            self._written = config.read()
+        self.__config__ = bson.loads(self._written)
 
     def _write(self):
-        with open(self.__configfile__, "wb") as config:
-            config.write(bson.dumps(self.__config__))
+        with self._lock:
+            self._dirty = True
+            if self._batch_depth:
+                return
+            if not self.flush_delay:
+                self.flush()
+                return
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self.flush_delay, self.flush
+                )
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+
+            # Stay dirty until the write went through, so a failed write is
+            # retried by the next mutation or at exit.
+            data = bson.dumps(self.__config__)
+            if data != self._written:
+                utils.atomic_write(self.__configfile__, data)
+                self._written = data
+            self._dirty = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._dirty:
+                    self.flush()
 
     def get(self):
         return self.__config__
 
     def set(self, config_dict):
-        self.__config__ = config_dict
-        self._write()
+        with self._lock:
+            self.__config__ = config_dict
+            self._write()
 
     def reset(self,):
-        self.__config__ = {}
-        self._write()
+        with self._lock:
+            self.__config__ = {}
+            self._write()
 
     def add_section(self, section):
-        if section in self.__config__:
-            raise ConfigurationError("Section \"{}\" already exists.".format(section))
+        with self._lock:
+            if section in self.__config__:
+                raise ConfigurationError("Section \"{}\" already exists.".format(section))
 
-        self.__config__.setdefault(section, {})
-        self._write()
+            self.__config__.setdefault(section, {})
+            self._write()
 
     def get_section(self, section):
         if section not in self.__config__:
@@ -58,28 +128,32 @@ class Configuration(object):
         return self.__config__[section]
 
     def set_section(self, section, config):
-        if section not in self.__config__:
-            raise ConfigurationError("Invalid section: \"{}\"".format(section))
-        self.__config__[section] = config
-        self._write()
+        with self._lock:
+            if section not in self.__config__:
+                raise ConfigurationError("Invalid section: \"{}\"".format(section))
+            self.__config__[section] = config
+            self._write()
 
     def update_section(self, section, changes):
-        if section not in self.__config__:
-            raise ConfigurationError("Invalid section: \"{}\"".format(section))
-        self.__config__[section].update(changes)
-        self._write()
+        with self._lock:
+            if section not in self.__config__:
+                raise ConfigurationError("Invalid section: \"{}\"".format(section))
+            self.__config__[section].update(changes)
+            self._write()
 
     def has_section(self, section):
         return section in self.__config__
 
     def reset_section(self, section):
-        if section not in self.__config__:
-            raise ConfigurationError("Invalid section: \"{}\"".format(section))
-        self.__config__[section] = {}
-        self._write()
+        with self._lock:
+            if section not in self.__config__:
+                raise ConfigurationError("Invalid section: \"{}\"".format(section))
+            self.__config__[section] = {}
+            self._write()
 
     def delete_section(self, section):
-        if section not in self.__config__:
-            raise ConfigurationError("Invalid section: \"{}\"".format(section))
-        del self.__config__[section]
-        self._write()
+        with self._lock:
+            if section not in self.__config__:
+                raise ConfigurationError("Invalid section: \"{}\"".format(section))
+            del self.__config__[section]
+            self._write()
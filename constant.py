@@ -1 +1,25 @@
-DEBUG = True
+DEBUG = False
+
+# Queue edits made in the views to a background writer instead of
+# committing them on the GUI thread.
+WRITE_BEHIND = False
+
+# Load the views' rows on a worker thread instead of selecting them on the
+# GUI thread. Paged views keep reading page by page.
+ASYNC_SELECT = True
+
+PRIORITIES = dict((
+    (1, "Today"),
+    (2, "Later"),
+    (3, "Sometime"),
+    (4, "Someday")
+))
+
+# Item lifespans in seconds.
+# {priority: (active lifespan, completed lifespan)}
+LIFESPANS = dict((
+    (1, (8 * 60 * 60, 5 * 60)),
+    (2, (12 * 60 * 60, 5 * 60)),
+    (3, (5 * 24 * 60 * 60, 5 * 60)),
+    (4, (None, 5 * 60))
+))
@@ -0,0 +1,1369 @@
+import collections
+import contextlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from todo import instrument
+
+SCHEMA_VERSION = 6
+
+TABLE = u"todos"
+
+FIELDS = [
+    ("completed", "INTEGER"),
+    ("title", "TEXT"),
+    ("timestamp", "INTEGER"),
+    ("priority", "INTEGER"),
+]
+
+INDEXES = [
+    ("todos_priority_completed_timestamp", ("priority", "completed", "timestamp")),
+]
+
+SEARCH_TABLE = u"todos_fts"
+
+SEARCH_TRIGGERS = [
+    (
+        "todos_fts_insert",
+        "AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {search}(rowid, title) VALUES (new.id, new.title); "
+        "END"
+    ),
+    (
+        "todos_fts_delete",
+        "AFTER DELETE ON {table} BEGIN "
+        "INSERT INTO {search}({search}, rowid, title) "
+        "VALUES ('delete', old.id, old.title); "
+        "END"
+    ),
+    (
+        "todos_fts_update",
+        "AFTER UPDATE OF title ON {table} BEGIN "
+        "INSERT INTO {search}({search}, rowid, title) "
+        "VALUES ('delete', old.id, old.title); "
+        "INSERT INTO {search}(rowid, title) VALUES (new.id, new.title); "
+        "END"
+    ),
+]
+
+# Per-priority counters bumped by triggers on every write, so readers can
+# tell which priorities another connection touched.
+REVISION_TABLE = u"todo_revisions"
+
+REVISION_BUMP = (
+    "INSERT INTO {revisions}(priority, revision) VALUES ({priority}, 1) "
+    "ON CONFLICT(priority) DO UPDATE SET revision = revision + 1; "
+)
+
+# The id written at every revision, so readers can re-read just those
+# todos. A NULL id stands for writes too many to list.
+CHANGE_TABLE = u"todo_changes"
+
+CHANGE_LOG = (
+    "INSERT INTO {changes}(priority, revision, id) "
+    "SELECT priority, revision, {id} FROM {revisions} "
+    "WHERE priority = {priority}; "
+)
+
+# Revisions logged per priority; readers further behind reload it.
+CHANGE_LOG_SIZE = 10000
+
+REVISION_STEP = REVISION_BUMP + CHANGE_LOG
+
+REVISION_TRIGGERS = [
+    (
+        "todos_revision_insert",
+        "AFTER INSERT ON {table} BEGIN "
+        + REVISION_STEP.format(
+            revisions="{revisions}", changes="{changes}",
+            priority="new.priority", id="new.id"
+        )
+        + "END"
+    ),
+    (
+        "todos_revision_delete",
+        "AFTER DELETE ON {table} BEGIN "
+        + REVISION_STEP.format(
+            revisions="{revisions}", changes="{changes}",
+            priority="old.priority", id="old.id"
+        )
+        + "END"
+    ),
+    (
+        "todos_revision_update",
+        "AFTER UPDATE ON {table} BEGIN "
+        + REVISION_STEP.format(
+            revisions="{revisions}", changes="{changes}",
+            priority="old.priority", id="old.id"
+        )
+        + REVISION_STEP.format(
+            revisions="{revisions}", changes="{changes}",
+            priority="new.priority", id="new.id"
+        )
+        + "END"
+    ),
+]
+
+# Expired completed todos are moved here instead of being deleted. sqlite
+# has no partitions, so rows carry their month (yyyymm) and are indexed by
+# it instead.
+ARCHIVE_TABLE = u"archive"
+
+ARCHIVE_INDEXES = [
+    ("archive_month", ("month",)),
+]
+
+# Todos archived per transaction, so a big sweep never holds the write
+# lock for long.
+ARCHIVE_BATCH_SIZE = 500
+
+# Free pages returned to the file system per incremental vacuum pass.
+VACUUM_PAGES = 64
+
+# Seconds vacuum passes wait for a lock before leaving it for later.
+VACUUM_BUSY_TIMEOUT = 0.1
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds (999).
+MAX_VARIABLES = 900
+
+FIELD_NAMES = [field for field, datatype in FIELDS]
+
+# Built once, so every call hands sqlite3 the same string and reuses the
+# prepared statement from the connection's statement cache.
+INSERT_COMMAND = "INSERT INTO {}({}) VALUES ({})".format(
+    TABLE, ", ".join(FIELD_NAMES), ", ".join("?" for field in FIELD_NAMES)
+)
+DELETE_COMMAND = "DELETE FROM {} WHERE id = ?".format(TABLE)
+
+# Batches at least this big are inserted with the per-row search and
+# revision triggers swapped for one set based pass.
+BULK_INSERT_THRESHOLD = 1000
+
+# Rows copied per transaction while migrating, so an interrupted migration
+# only loses the batch in flight and resumes from there on the next start.
+MIGRATION_BATCH_SIZE = 10000
+
+
+class SchemaError(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def transaction(connection):
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except Exception:
+        connection.rollback()
+        raise
+    else:
+        commit(connection)
+
+
+def commit(connection):
+    if not instrument.enabled:
+        connection.commit()
+        return
+    started = time.perf_counter()
+    connection.commit()
+    instrument.observe("sql.commit", time.perf_counter() - started)
+
+
+def chunked(values, size=None):
+    values = list(values)
+    size = size or MAX_VARIABLES
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+def get_tables(connection):
+    return [
+        row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).fetchall()
+    ]
+
+
+def get_schema_version(connection):
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if not version and TABLE in get_tables(connection):
+        # Databases created before the schema was versioned.
+        return 1
+    return version
+
+
+def set_schema_version(connection, version):
+    connection.execute("PRAGMA user_version = {:d}".format(version))
+
+
+def create_table(connection, table=None):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS {} "
+        "(id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, {})".format(
+            table or TABLE,
+            ", ".join(
+                "{} {}".format(field, datatype) for field, datatype in FIELDS
+            )
+        )
+    )
+
+
+def create_indexes(connection):
+    for name, columns in INDEXES:
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                name, TABLE, ", ".join(columns)
+            )
+        )
+
+
+def has_search_index(connection):
+    return SEARCH_TABLE in get_tables(connection)
+
+
+def create_search_index(connection):
+    """Create the FTS5 index over titles, kept in sync by triggers.
+
+    Returns False when sqlite was built without FTS5, in which case search
+    falls back to scanning titles.
+    """
+    try:
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+            "title, content='{}', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(
+                SEARCH_TABLE, TABLE
+            )
+        )
+    except sqlite3.OperationalError:
+        return False
+
+    for name, body in SEARCH_TRIGGERS:
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS {} {}".format(
+                name, body.format(table=TABLE, search=SEARCH_TABLE)
+            )
+        )
+    return True
+
+
+def create_revisions(connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS {} (priority INTEGER PRIMARY KEY, "
+        "revision INTEGER NOT NULL DEFAULT 0)".format(REVISION_TABLE)
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS {} (priority INTEGER NOT NULL, "
+        "revision INTEGER NOT NULL, id INTEGER, "
+        "PRIMARY KEY (priority, revision))".format(CHANGE_TABLE)
+    )
+    for name, body in REVISION_TRIGGERS:
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS {} {}".format(
+                name, body.format(
+                    table=TABLE, revisions=REVISION_TABLE, changes=CHANGE_TABLE
+                )
+            )
+        )
+
+
+def insert_rows(connection, rows):
+    """Insert rows in FIELDS order; call inside a transaction.
+
+    For big batches the insert triggers are dropped, the search index and
+    revisions are brought up to date once, and the triggers are put back
+    before the caller commits.
+    """
+    rows = list(rows)
+    if len(rows) < BULK_INSERT_THRESHOLD:
+        connection.executemany(INSERT_COMMAND, rows)
+        return len(rows)
+
+    search = has_search_index(connection)
+    last_id = connection.execute(
+        "SELECT coalesce(max(id), 0) FROM {}".format(TABLE)
+    ).fetchone()[0]
+    for name in (SEARCH_TRIGGERS[0][0], REVISION_TRIGGERS[0][0]):
+        connection.execute("DROP TRIGGER IF EXISTS {}".format(name))
+
+    connection.executemany(INSERT_COMMAND, rows)
+
+    if search:
+        connection.execute(
+            "INSERT INTO {}(rowid, title) SELECT id, title FROM {} "
+            "WHERE id > ?".format(SEARCH_TABLE, TABLE),
+            (last_id,)
+        )
+        create_search_index(connection)
+    priority_index = FIELD_NAMES.index("priority")
+    for priority in set(row[priority_index] for row in rows):
+        connection.execute(
+            REVISION_BUMP.format(revisions=REVISION_TABLE, priority="?"),
+            (priority,)
+        )
+        connection.execute(
+            CHANGE_LOG.format(
+                changes=CHANGE_TABLE, revisions=REVISION_TABLE,
+                priority="?", id="NULL"
+            ),
+            (priority,)
+        )
+    create_revisions(connection)
+    return len(rows)
+
+
+def update_rows(connection, ids, changes):
+    """Apply the same changes to many ids; call inside a transaction."""
+    fields = [field for field in FIELD_NAMES if field in changes]
+    if not fields:
+        return 0
+
+    assignments = ", ".join("{} = ?".format(field) for field in fields)
+    values = [changes[field] for field in fields]
+    count = 0
+    for chunk in chunked(ids):
+        count += connection.execute(
+            "UPDATE {} SET {} WHERE id IN ({})".format(
+                TABLE, assignments, placeholders(chunk)
+            ),
+            values + chunk
+        ).rowcount
+    return count
+
+
+def get_update_command(fields):
+    return "UPDATE {} SET {} WHERE id = :id".format(
+        TABLE, ", ".join("{0} = :{0}".format(field) for field in fields)
+    )
+
+
+def create_archive(connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS {} "
+        "(id INTEGER NOT NULL PRIMARY KEY, {}, month INTEGER NOT NULL, "
+        "archived INTEGER NOT NULL)".format(
+            ARCHIVE_TABLE,
+            ", ".join(
+                "{} {}".format(field, datatype) for field, datatype in FIELDS
+            )
+        )
+    )
+    for name, columns in ARCHIVE_INDEXES:
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                name, ARCHIVE_TABLE, ", ".join(columns)
+            )
+        )
+
+
+def enable_incremental_vacuum(connection):
+    """Switch the file to auto_vacuum=INCREMENTAL.
+
+    The setting only sticks once the file is rebuilt with VACUUM, which
+    takes a while for a big file, so it is not done on the GUI thread.
+    Returns whether the file had to be rebuilt.
+    """
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    connection.execute("VACUUM")
+    return True
+
+
+@contextlib.contextmanager
+def busy_timeout(connection, timeout):
+    """Wait at most ``timeout`` seconds for locks inside the block."""
+    previous = connection.execute("PRAGMA busy_timeout").fetchone()[0]
+    connection.execute("PRAGMA busy_timeout = {:d}".format(int(timeout * 1000)))
+    try:
+        yield connection
+    finally:
+        connection.execute("PRAGMA busy_timeout = {:d}".format(previous))
+
+
+def get_free_pages(connection):
+    return connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def incremental_vacuum(connection, pages=None):
+    """Release up to ``pages`` free pages and return how many are left."""
+    # execute() only steps the pragma once, which frees a single page;
+    # executescript() runs it to completion (and commits first).
+    connection.executescript(
+        "PRAGMA incremental_vacuum({:d});".format(pages or VACUUM_PAGES)
+    )
+    return get_free_pages(connection)
+
+
+def archive_completed(connection, priority, before, batch_size=None):
+    """Move completed todos of a priority older than ``before`` to the archive.
+
+    Every batch is copied and deleted in its own transaction. Returns the
+    number of archived todos.
+    """
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    fields = ", ".join(FIELD_NAMES)
+    archived = 0
+    while True:
+        with transaction(connection):
+            ids = [
+                row[0] for row in connection.execute(
+                    "SELECT id FROM {} WHERE priority = ? AND completed = 1 "
+                    "AND timestamp < ? LIMIT ?".format(TABLE),
+                    (priority, before, batch_size)
+                ).fetchall()
+            ]
+            for chunk in chunked(ids):
+                connection.execute(
+                    "INSERT OR REPLACE INTO {archive} (id, {fields}, month, "
+                    "archived) SELECT id, {fields}, CAST(STRFTIME('%Y%m', "
+                    "timestamp, 'unixepoch', 'localtime') AS INTEGER), ? "
+                    "FROM {table} WHERE id IN ({ids})".format(
+                        archive=ARCHIVE_TABLE,
+                        fields=fields,
+                        table=TABLE,
+                        ids=placeholders(chunk)
+                    ),
+                    [get_timestamp()] + chunk
+                )
+                connection.execute(
+                    "DELETE FROM {} WHERE id IN ({})".format(
+                        TABLE, placeholders(chunk)
+                    ),
+                    chunk
+                )
+        archived += len(ids)
+        if len(ids) < batch_size:
+            return archived
+
+
+def create_schema(connection):
+    # Takes effect without a rebuild while the file has no tables yet.
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    with transaction(connection):
+        create_table(connection)
+        create_indexes(connection)
+        create_search_index(connection)
+        create_revisions(connection)
+        create_archive(connection)
+        set_schema_version(connection, SCHEMA_VERSION)
+
+
+def migrate_v2(connection, batch_size=None):
+    """Copy todos into a table with INTEGER epoch timestamps.
+
+    Numeric text is cast directly, anything else is parsed as a date string.
+    Rows are copied in id order, so a partially filled ``todos_v2`` from an
+    interrupted run is picked up where it stopped.
+    """
+    staging_table = "{}_v2".format(TABLE)
+    create_table(connection, staging_table)
+    connection.commit()
+
+    while True:
+        last_id = connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM {}".format(staging_table)
+        ).fetchone()[0]
+        with transaction(connection):
+            copied = connection.execute(
+                """
+                INSERT INTO {staging} (id, completed, title, timestamp, priority)
+                SELECT id, completed, title,
+                    CASE
+                        WHEN TRIM(timestamp) != ''
+                            AND TRIM(timestamp) NOT GLOB '*[^0-9.]*'
+                        THEN CAST(timestamp AS INTEGER)
+                        ELSE COALESCE(
+                            CAST(STRFTIME('%s', timestamp) AS INTEGER),
+                            CAST(STRFTIME('%s', 'now') AS INTEGER)
+                        )
+                    END,
+                    priority
+                FROM {table} WHERE id > ? ORDER BY id LIMIT ?
+                """.format(staging=staging_table, table=TABLE),
+                (last_id, batch_size or MIGRATION_BATCH_SIZE)
+            ).rowcount
+        if not copied:
+            break
+
+    with transaction(connection):
+        connection.execute("DROP TABLE {}".format(TABLE))
+        connection.execute(
+            "ALTER TABLE {} RENAME TO {}".format(staging_table, TABLE)
+        )
+        create_indexes(connection)
+        set_schema_version(connection, 2)
+
+
+def migrate_v3(connection):
+    with transaction(connection):
+        if create_search_index(connection):
+            connection.execute(
+                "INSERT INTO {0}({0}) VALUES ('rebuild')".format(SEARCH_TABLE)
+            )
+        set_schema_version(connection, 3)
+
+
+def migrate_v4(connection):
+    with transaction(connection):
+        create_revisions(connection)
+        set_schema_version(connection, 4)
+
+
+def migrate_v5(connection):
+    with transaction(connection):
+        create_archive(connection)
+        set_schema_version(connection, 5)
+
+
+def migrate_v6(connection):
+    with transaction(connection):
+        # The revision triggers log changed ids from now on.
+        for name, body in REVISION_TRIGGERS:
+            connection.execute("DROP TRIGGER IF EXISTS {}".format(name))
+        create_revisions(connection)
+        set_schema_version(connection, 6)
+
+
+# {target version: migration}
+MIGRATIONS = {
+    2: migrate_v2,
+    3: migrate_v3,
+    4: migrate_v4,
+    5: migrate_v5,
+    6: migrate_v6,
+}
+
+
+def ensure_schema(connection):
+    version = get_schema_version(connection)
+    if not version:
+        create_schema(connection)
+        return SCHEMA_VERSION
+
+    if version > SCHEMA_VERSION:
+        raise SchemaError(
+            "Database schema version {} is newer than the supported "
+            "version {}.".format(version, SCHEMA_VERSION)
+        )
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[target](connection)
+    return SCHEMA_VERSION
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    return " ".join(
+        '"{}"*'.format(token) for token in re.findall(r"\w+", text, re.UNICODE)
+    )
+
+
+def iter_search(connection, text, batch_size=None):
+    """Yield batches of matching todo rows, newest first.
+
+    Results follow the index rowid order rather than rank, so the first
+    batch is available without scoring every match of a short prefix.
+    """
+    columns = ", ".join(
+        "{}.{}".format(TABLE, field)
+        for field in ["id"] + [field for field, datatype in FIELDS]
+    )
+    if has_search_index(connection):
+        query = build_match_query(text)
+        if not query:
+            return
+        cursor = connection.execute(
+            "SELECT {columns} FROM {search} "
+            "JOIN {table} ON {table}.id = {search}.rowid "
+            "WHERE {search} MATCH ? ORDER BY {search}.rowid DESC".format(
+                columns=columns, search=SEARCH_TABLE, table=TABLE
+            ),
+            (query,)
+        )
+    else:
+        text = text.strip()
+        if not text:
+            return
+        cursor = connection.execute(
+            "SELECT {} FROM {} WHERE title LIKE ? ORDER BY id DESC".format(
+                columns, TABLE
+            ),
+            (u"%{}%".format(text),)
+        )
+
+    while True:
+        rows = cursor.fetchmany(batch_size or 50)
+        if not rows:
+            break
+        yield [tuple(row) for row in rows]
+
+
+def configure(connection):
+    # WAL lets readers and a writer from other processes proceed together,
+    # and NORMAL only syncs on checkpoints, which WAL keeps crash safe.
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+
+
+def get_data_version(connection):
+    return connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_revisions(connection):
+    return dict(
+        (row[0], row[1]) for row in connection.execute(
+            "SELECT priority, revision FROM {}".format(REVISION_TABLE)
+        ).fetchall()
+    )
+
+
+def get_changes(connection, priority, revision):
+    """Return the ids written to a priority since ``revision``.
+
+    None if the log no longer reaches back that far or some of the writes
+    were not logged one by one.
+    """
+    rows = connection.execute(
+        "SELECT revision, id FROM {} WHERE priority = ? AND revision > ? "
+        "ORDER BY revision".format(CHANGE_TABLE),
+        (priority, revision)
+    ).fetchall()
+    if not rows or rows[0][0] != revision + 1:
+        return None
+    ids = set(row[1] for row in rows)
+    if None not in ids:
+        return ids
+
+
+def prune_changes(connection, size=None):
+    """Keep the last ``size`` logged revisions of every priority."""
+    with transaction(connection):
+        for priority, revision in get_revisions(connection).items():
+            connection.execute(
+                "DELETE FROM {} WHERE priority = ? AND revision <= ?".format(
+                    CHANGE_TABLE
+                ),
+                (priority, revision - (size or CHANGE_LOG_SIZE))
+            )
+
+
+def get_timestamp():
+    return int(time.time())
+
+
+def get_database_file():
+    return os.path.join(os.environ.get("HOME"), ".config", "todo", "config")
+
+
+class ConnectionRegistry(object):
+    """Process-wide owner of the sqlite connections to the todo database.
+
+    Connections are created lazily, one per thread, and the schema is
+    ensured only once for the first of them.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    # Seconds a connection waits on a lock held by another connection.
+    busy_timeout = 5.0
+
+    # Prepared statements kept per connection (sqlite3 defaults to 100).
+    cached_statements = 256
+
+    def __init__(self, path=None):
+        super(ConnectionRegistry, self).__init__()
+        self.path = path or get_database_file()
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @classmethod
+    def instance(cls):
+        with ConnectionRegistry._shared_lock:
+            if cls.__dict__.get("_shared") is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def set_instance(cls, registry):
+        with ConnectionRegistry._shared_lock:
+            cls._shared = registry
+
+    def ensure_directory(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o755)
+
+    def connect(self):
+        self.ensure_directory()
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements
+        )
+        connection.row_factory = sqlite3.Row
+        if instrument.enabled:
+            instrument.trace_connection(connection)
+        configure(connection)
+
+        with self._schema_lock:
+            if not self._schema_ready:
+                ensure_schema(connection)
+                self._schema_ready = True
+
+        return connection
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def get_sort_key(key):
+    # sqlite sorts NULL before everything else.
+    return tuple((value is not None, value) for value in key)
+
+
+class PageStore(object):
+    """Keyset-paginated window onto the todos of a single priority.
+
+    Rows are read in (completed, timestamp, id) order, the order of the
+    priority index, one page at a time, into a bounded LRU of pages. Every
+    discovered page keeps an anchor: a key and how many rows past the last
+    row up to that key the page starts. Known changes move the anchors
+    along instead of re-reading the window, and pages dropped from the
+    cache are re-read from the closest anchor.
+    """
+
+    order = ("completed", "timestamp", "id")
+    # find() only knows the rows of cached pages.
+    partial_index = True
+
+    def __init__(self, registry, priority, page_size=None, cache_size=None):
+        super(PageStore, self).__init__()
+        self.registry = registry
+        self.priority = priority
+        self.page_size = page_size or 256
+        self.cache_size = cache_size or 64
+        self.columns = ["id"] + [field for field, datatype in FIELDS]
+        self._key_columns = [self.columns.index(name) for name in self.order]
+        self.reset()
+
+    def reset(self):
+        self._pages = collections.OrderedDict()
+        # {id: (page, offset)} for the rows of the cached pages.
+        self._rows_by_id = {}
+        # [key, skip] for every discovered page and the one after them,
+        # a key of None being the start of the priority.
+        self._anchors = [[None, 0]]
+        self.loaded = 0
+        self.exhausted = False
+
+    def invalidate(self):
+        self._pages.clear()
+        self._rows_by_id.clear()
+
+    def key(self, values):
+        return tuple(values[column] for column in self._key_columns)
+
+    def query(self, key=None, limit=-1, offset=0, descending=False):
+        """Read rows past ``key``, or up to and including it backwards."""
+        command = "SELECT {} FROM {} WHERE priority = ?".format(
+            ", ".join(self.columns), TABLE
+        )
+        parameters = [self.priority]
+        if key is not None:
+            command += " AND ({}) {} (?, ?, ?)".format(
+                ", ".join(self.order), "<=" if descending else ">"
+            )
+            parameters.extend(key)
+        command += " ORDER BY {} LIMIT ? OFFSET ?".format(", ".join(
+            "{} DESC".format(column) if descending else column
+            for column in self.order
+        ))
+        parameters.extend([limit, offset])
+
+        rows = [
+            tuple(row) for row in
+            self.registry.connection().execute(command, parameters).fetchall()
+        ]
+        return rows[::-1] if descending else rows
+
+    def count(self, low=None, high=None, limit=-1):
+        """Count the rows between the keys ``low`` and ``high``, to ``limit``."""
+        command = "SELECT 1 FROM {} WHERE priority = ?".format(TABLE)
+        parameters = [self.priority]
+        for key, operator in ((low, ">"), (high, "<")):
+            if key is not None:
+                command += " AND ({}) {} (?, ?, ?)".format(
+                    ", ".join(self.order), operator
+                )
+                parameters.extend(key)
+        command += " LIMIT ?"
+        parameters.append(limit)
+
+        return self.registry.connection().execute(
+            "SELECT count(*) FROM ({})".format(command), parameters
+        ).fetchone()[0]
+
+    def read_rows(self, first, count):
+        """Read ``count`` rows from row ``first`` on.
+
+        Returns the key of the row before them, None at the start of the
+        priority, along with the rows.
+        """
+        nearest = None
+        last = min(first // self.page_size, len(self._anchors) - 1)
+        for number in range(last, -1, -1):
+            key, skip = self._anchors[number]
+            offset = skip + first - number * self.page_size
+            if nearest is None or abs(offset) < abs(nearest[1]):
+                nearest = key, offset
+            if not skip:
+                break
+
+        key, offset = nearest
+        if offset > 0:
+            rows = self.query(key, count + 1, offset - 1)
+            previous, rows = rows[:1], rows[1:]
+        else:
+            rows = []
+            if key is not None:
+                rows = self.query(key, 1 - offset, descending=True)
+            previous = []
+            if len(rows) > -offset:
+                previous, rows = rows[:1], rows[1:]
+            rows = rows[:count]
+            if len(rows) < count:
+                rows.extend(self.query(key, count - len(rows)))
+        return (self.key(previous[0]) if previous else None), rows
+
+    def read_page(self, number, count):
+        previous, rows = self.read_rows(number * self.page_size, count)
+        if previous is not None or not number:
+            self._anchors[number] = [previous, 0]
+        return rows
+
+    def unindex(self, number, rows):
+        for values in rows:
+            location = self._rows_by_id.get(values[0])
+            if location is not None and location[0] == number:
+                del self._rows_by_id[values[0]]
+
+    def cache_page(self, number, rows):
+        self.drop_pages(number, number)
+        self._pages[number] = rows
+        for offset, values in enumerate(rows):
+            self._rows_by_id[values[0]] = (number, offset)
+        while len(self._pages) > self.cache_size:
+            self.unindex(*self._pages.popitem(last=False))
+
+    def drop_pages(self, first, last=None):
+        """Forget cached pages whose rows moved, they are read again."""
+        for number in [
+            number for number in self._pages
+            if first <= number and (last is None or number <= last)
+        ]:
+            self.unindex(number, self._pages.pop(number))
+
+    def read_next(self):
+        if self.exhausted:
+            return []
+        return self.read_page(self.loaded // self.page_size, self.page_size)
+
+    def append(self, rows):
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if rows:
+            number = self.loaded // self.page_size
+            self.cache_page(number, list(rows))
+            self.loaded += len(rows)
+            del self._anchors[number + 1:]
+            self._anchors.append([
+                self.key(rows[-1]),
+                (number + 1) * self.page_size - self.loaded
+            ])
+
+    def fetch_more(self):
+        rows = self.read_next()
+        self.append(rows)
+        return len(rows)
+
+    def ensure_anchors(self):
+        while len(self._anchors) <= self.loaded // self.page_size:
+            key, skip = self._anchors[-1]
+            self._anchors.append([key, skip + self.page_size])
+
+    def shift_anchors(self, key, delta):
+        """Account for a row taken out at (1) or put in at (-1) ``key``."""
+        key = get_sort_key(key)
+        for anchor in self._anchors:
+            if anchor[0] is not None and key <= get_sort_key(anchor[0]):
+                anchor[1] += delta
+
+    def reanchor(self):
+        """Start over from the first row after changes in unknown places.
+
+        Returns how many rows the window can hold now: all of them once
+        read to the end, otherwise up to one past the loaded ones.
+        """
+        self.invalidate()
+        self._anchors = [
+            [None, number * self.page_size]
+            for number in range(len(self._anchors))
+        ]
+        return self.count(limit=-1 if self.exhausted else self.loaded + 1)
+
+    def resize(self, count):
+        if count <= self.loaded:
+            self.exhausted = True
+        if self.exhausted:
+            self.loaded = count
+            self.ensure_anchors()
+
+    def find(self, id):
+        location = self._rows_by_id.get(id)
+        if location is not None:
+            return location[0] * self.page_size + location[1]
+
+    def position(self, values, row=None):
+        """Return where ``values`` belongs once ``row`` is taken out.
+
+        The rows before it are counted from the closest anchor under it.
+        Past the loaded rows of a window that was not read to the end,
+        that is just ``loaded``.
+        """
+        key = self.key(values)
+        sort_key = get_sort_key(key)
+        number, closest = 0, None
+        for index, (anchor, skip) in enumerate(self._anchors):
+            if anchor is not None:
+                anchor = get_sort_key(anchor)
+                if anchor < sort_key and (closest is None or anchor > closest):
+                    number, closest = index, anchor
+        anchor, skip = self._anchors[number]
+
+        before = number * self.page_size - skip
+        if row is not None and closest is not None and get_sort_key(
+                self.key(self.row(row))
+        ) <= closest:
+            before -= 1
+        if self.exhausted:
+            return before + self.count(anchor, key)
+        return min(
+            before + self.count(
+                anchor, key, max(self.loaded - before, 0) + 1
+            ),
+            self.loaded
+        )
+
+    def update(self, row, values):
+        rows = self._pages.get(row // self.page_size)
+        offset = row % self.page_size
+        if rows is not None and offset < len(rows):
+            rows[offset] = tuple(values)
+
+    def insert(self, row, values):
+        """Add a row; past the loaded ones only the anchors change."""
+        self.shift_anchors(self.key(values), -1)
+        if row < self.loaded or self.exhausted:
+            self.loaded += 1
+            self.ensure_anchors()
+            self.drop_pages(row // self.page_size)
+
+    def remove(self, row):
+        self.shift_anchors(self.key(self.row(row)), 1)
+        self.loaded -= 1
+        self.drop_pages(row // self.page_size)
+
+    def move(self, row, target, values):
+        old = self.key(self.row(row))
+        if old != self.key(values):
+            self.shift_anchors(old, 1)
+            self.shift_anchors(self.key(values), -1)
+        if target == row:
+            self.update(row, values)
+        else:
+            self.drop_pages(
+                min(row, target) // self.page_size,
+                max(row, target) // self.page_size
+            )
+
+    def trim(self):
+        """Drop the row pushed past a window not read to the end."""
+        self.loaded -= 1
+        self.drop_pages(self.loaded // self.page_size)
+
+    def has_more(self):
+        """Whether a row follows the loaded ones, after one was removed."""
+        if not self.exhausted and not self.read_rows(self.loaded, 1)[1]:
+            self.exhausted = True
+        return not self.exhausted
+
+    def grow(self):
+        self.loaded += 1
+        self.ensure_anchors()
+        self.drop_pages((self.loaded - 1) // self.page_size)
+
+    def page(self, number):
+        rows = self._pages.get(number)
+        if rows is None:
+            first = number * self.page_size
+            rows = self.read_page(
+                number, min(self.page_size, self.loaded - first)
+            )
+            self.cache_page(number, rows)
+        else:
+            self._pages.move_to_end(number)
+        return rows
+
+    def row(self, row):
+        rows = self.page(row // self.page_size)
+        offset = row % self.page_size
+        if offset < len(rows):
+            return rows[offset]
+
+
+def iter_rows(connection, priority, batch_size=None):
+    """Yield all rows of a priority in PageStore order, in batches."""
+    cursor = connection.execute(
+        "SELECT {} FROM {} WHERE priority = ? ORDER BY {}".format(
+            ", ".join(["id"] + FIELD_NAMES), TABLE, ", ".join(PageStore.order)
+        ),
+        (priority,)
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size or 500)
+        if not rows:
+            break
+        yield [tuple(row) for row in rows]
+
+
+def get_rows(connection, ids):
+    """Return {id: row} for the todos in ``ids``, in iter_rows columns."""
+    rows = {}
+    for chunk in chunked(ids):
+        for row in connection.execute(
+            "SELECT {} FROM {} WHERE id IN ({})".format(
+                ", ".join(["id"] + FIELD_NAMES), TABLE, placeholders(chunk)
+            ),
+            chunk
+        ):
+            rows[row[0]] = tuple(row)
+    return rows
+
+
+class RowStore(object):
+    """All rows of a priority held in memory, with the PageStore interface.
+
+    Rows are appended by whoever loads them, e.g. a query on a worker
+    thread, so there is never anything left to fetch.
+    """
+
+    order = PageStore.order
+    partial_index = False
+    exhausted = True
+
+    def __init__(self, priority):
+        super(RowStore, self).__init__()
+        self.priority = priority
+        self.columns = ["id"] + FIELD_NAMES
+        self._key_columns = [self.columns.index(name) for name in self.order]
+        self.reset()
+
+    @property
+    def loaded(self):
+        return len(self.rows)
+
+    def reset(self):
+        self.rows = []
+        # {id: row}, kept in step with every change to rows.
+        self._rows_by_id = {}
+
+    def replace(self, rows):
+        self.rows = list(rows)
+        self._rows_by_id = {}
+        self.reindex(0)
+
+    def reindex(self, first, last=None):
+        last = len(self.rows) - 1 if last is None else last
+        for row in range(first, last + 1):
+            self._rows_by_id[self.rows[row][0]] = row
+
+    def key(self, values):
+        return get_sort_key(values[column] for column in self._key_columns)
+
+    def find(self, id):
+        return self._rows_by_id.get(id)
+
+    def position(self, values, row=None):
+        """Return where ``values`` belongs once ``row`` is taken out."""
+        key = self.key(values)
+        low, high = 0, len(self.rows) - (row is not None)
+        while low < high:
+            middle = (low + high) // 2
+            index = middle if row is None or middle < row else middle + 1
+            if self.key(self.rows[index]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def update(self, row, values):
+        self.rows[row] = tuple(values)
+
+    def insert(self, row, values):
+        self.rows.insert(row, tuple(values))
+        self.reindex(row)
+
+    def remove(self, row):
+        del self._rows_by_id[self.rows.pop(row)[0]]
+        self.reindex(row)
+
+    def move(self, row, target, values):
+        self.rows.pop(row)
+        self.rows.insert(target, tuple(values))
+        self.reindex(min(row, target), max(row, target))
+
+    def read_next(self):
+        return []
+
+    def append(self, rows):
+        first = len(self.rows)
+        self.rows.extend(rows)
+        self.reindex(first)
+
+    def fetch_more(self):
+        return 0
+
+    def row(self, row):
+        if row < len(self.rows):
+            return self.rows[row]
+
+
+class TodoDatabase(object):
+    """Qt-free access to the todos, shared by the GUI and the CLI."""
+    registry_class = ConnectionRegistry
+
+    def __init__(self, registry=None):
+        super(TodoDatabase, self).__init__()
+        self.registry = registry or self.registry_class.instance()
+        self.table = TABLE
+
+        # if not self.session.execute(
+        #     """select COUNT(*) from {}""".format(self.table)
+        # ).fetchone()[0]:
+        #     self.populate_test_data(5)
+
+    @property
+    def connection(self):
+        return self.registry.connection()
+
+    @property
+    def session(self):
+        return self.connection.cursor()
+
+    @property
+    def fields(self):
+        return FIELDS
+
+    @property
+    def tables(self):
+        return [
+            row["name"] for row in self.session.execute(
+                "select name from sqlite_master where type = 'table'"
+            ).fetchall()
+        ]
+
+    @property
+    def table_info(self):
+        return self.session.execute(
+            "PRAGMA TABLE_INFO({})".format(self.table)
+        ).fetchall()
+
+    def get_row(self, data):
+        return tuple(data[field] for field in FIELD_NAMES)
+
+    def add_entry(self, data):
+        instrument.count("database.add_entry")
+        with transaction(self.connection) as connection:
+            cursor = connection.execute(INSERT_COMMAND, self.get_row(data))
+        return cursor.lastrowid
+
+    def add_many(self, entries):
+        """Insert entries in one transaction and return how many."""
+        with transaction(self.connection) as connection:
+            return insert_rows(
+                connection, (self.get_row(data) for data in entries)
+            )
+
+    def remove_entry(self, data):
+        return self.remove_many([data["id"]])
+
+    def remove_many(self, ids):
+        """Delete todos by id in one transaction and return how many."""
+        with transaction(self.connection) as connection:
+            return connection.executemany(
+                DELETE_COMMAND, [(id,) for id in ids]
+            ).rowcount
+
+    def update_entry(self, data):
+        self.update_many([data])
+        return True
+
+    def update_many(self, entries):
+        """Apply {"id": ..., field: value} dicts in one transaction.
+
+        None values are left untouched. Entries changing the same fields
+        share one prepared statement. Returns the number of updated rows.
+        """
+        groups = collections.OrderedDict()
+        for data in entries:
+            fields = tuple(
+                field for field in FIELD_NAMES if data.get(field) is not None
+            )
+            if fields:
+                groups.setdefault(fields, []).append(data)
+
+        count = 0
+        with transaction(self.connection) as connection:
+            for fields, group in groups.items():
+                count += connection.executemany(
+                    get_update_command(fields), group
+                ).rowcount
+        return count
+
+    def process_lifespans(self, lifespans, timestamp=None):
+        """Demote expired active items and archive expired completed ones.
+
+        Completed items are moved to the archive in batches first. The
+        demotions then run as set-based statements in a single transaction,
+        walking priorities from the lowest upwards so that an item is
+        demoted at most one step per sweep. Returns the set of priorities
+        whose rows changed.
+        """
+        timestamp = timestamp or get_timestamp()
+        lowest_priority = max(lifespans)
+        affected = set()
+
+        for priority in sorted(lifespans, reverse=True):
+            completed_lifespan = lifespans[priority][1]
+            if completed_lifespan is not None and archive_completed(
+                    self.connection, priority, timestamp - completed_lifespan
+            ):
+                affected.add(priority)
+
+        with transaction(self.connection):
+            for priority in sorted(lifespans, reverse=True):
+                active_lifespan = lifespans[priority][0]
+                if active_lifespan is not None and priority < lowest_priority:
+                    if self.session.execute(
+                        """
+                        UPDATE {} SET priority = priority + 1
+                        WHERE priority = ? AND completed = 0
+                        AND timestamp < ?
+                        """.format(self.table),
+                        (priority, timestamp - active_lifespan)
+                    ).rowcount:
+                        affected.update((priority, priority + 1))
+
+        return affected
+
+    def free_pages(self):
+        return get_free_pages(self.connection)
+
+    def vacuum(self, pages=None):
+        """Release up to ``pages`` free pages without waiting on locks.
+
+        A file not in incremental mode yet is rebuilt instead.
+        """
+        with busy_timeout(self.connection, VACUUM_BUSY_TIMEOUT):
+            if enable_incremental_vacuum(self.connection):
+                return get_free_pages(self.connection)
+            return incremental_vacuum(self.connection, pages)
+
+    def update_entries(self, ids, changes):
+        if not any(field in changes for field in FIELD_NAMES):
+            return False
+
+        with transaction(self.connection) as connection:
+            update_rows(connection, ids, changes)
+        return True
+
+    def iter_entries(self, priority=None, completed=None, batch_size=None):
+        conditions = []
+        parameters = []
+        if priority is not None:
+            conditions.append("priority = ?")
+            parameters.append(priority)
+        if completed is not None:
+            conditions.append("completed = ?")
+            parameters.append(int(completed))
+
+        command = "SELECT id, {} FROM {}".format(
+            ", ".join(field for field, datatype in self.fields), self.table
+        )
+        if conditions:
+            command += " WHERE " + " AND ".join(conditions)
+        command += " ORDER BY priority, completed, timestamp, id"
+
+        cursor = self.session
+        cursor.execute(command, parameters)
+        while True:
+            rows = cursor.fetchmany(batch_size or 500)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+    def data_version(self):
+        return get_data_version(self.connection)
+
+    def revisions(self):
+        return get_revisions(self.connection)
+
+    def changes(self, priority, revision):
+        return get_changes(self.connection, priority, revision)
+
+    def prune_changes(self):
+        return prune_changes(self.connection)
+
+    def get_entries(self, ids):
+        return get_rows(self.connection, ids)
+
+    def search(self, text, batch_size=None):
+        return iter_search(self.connection, text, batch_size)
+
+    def populate_test_data(self, count=None):
+        priorities = range(1, 5)
+        timestamp = get_timestamp()
+        return self.add_many(
+            {
+                "completed": random.choice([0, 1]),
+                "title": "test todo {}".format(index),
+                "timestamp": timestamp,
+                "priority": random.choice(priorities),
+            }
+            for index in range(1, (count or 20) + 1)
+        )
@@ -0,0 +1,70 @@
+"""Hidden instrumentation panel, opened with Ctrl+Shift+D."""
+import json
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from todo import instrument, todo
+
+
+class TodoDebugPanel(QtWidgets.QDialog, object):
+    def __init__(self, parent=None, interval=None):
+        super(TodoDebugPanel, self).__init__(parent)
+        self.setWindowTitle("Instrumentation")
+        self.resize(480, 560)
+
+        self.report_view = QtWidgets.QPlainTextEdit()
+        self.report_view.setReadOnly(True)
+        self.report_view.setFont(
+            QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        )
+        self.enabled_box = QtWidgets.QCheckBox("Enabled")
+        self.enabled_box.setChecked(instrument.enabled)
+        self.enabled_box.toggled.connect(self.set_enabled)
+        reset_button = QtWidgets.QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        dump_button = QtWidgets.QPushButton("Dump")
+        dump_button.clicked.connect(instrument.dump)
+
+        layout = QtWidgets.QGridLayout()
+        layout.addWidget(self.report_view, 0, 0, 1, 4)
+        layout.addWidget(self.enabled_box, 1, 0)
+        layout.addWidget(reset_button, 1, 2)
+        layout.addWidget(dump_button, 1, 3)
+        layout.setColumnStretch(1, 1)
+        self.setLayout(layout)
+
+        self.timer = QtCore.QTimer(self)
+        # Refresh interval in milliseconds.
+        self.timer.setInterval(interval or 1000)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_enabled(self, enabled):
+        if enabled:
+            instrument.enable()
+            todo.install_instrumentation()
+            # Connections opened from now on are traced on connect.
+            instrument.trace_connection(
+                todo.TodoConnectionRegistry.instance().connection()
+            )
+        else:
+            instrument.disable()
+        self.refresh()
+
+    def reset(self):
+        instrument.reset()
+        self.refresh()
+
+    def refresh(self):
+        scroll_bar = self.report_view.verticalScrollBar()
+        position = scroll_bar.value()
+        self.report_view.setPlainText(json.dumps(instrument.report(), indent=2))
+        scroll_bar.setValue(position)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super(TodoDebugPanel, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super(TodoDebugPanel, self).hideEvent(event)
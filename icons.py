@@ -0,0 +1,86 @@
+"""Process-wide cache of the qtawesome toolbar icons.
+
+qtawesome renders its glyphs every time an icon is painted, so icons are
+rasterized once per (name, color, size) into pixmap-backed QIcons and
+shared by every window and widget.
+"""
+import collections
+
+from PyQt5 import QtCore, QtGui
+import qtawesome
+
+
+ICONS = {
+    "font": "fa5s.font",
+    "color": "fa5s.palette",
+    "dock": "fa5s.anchor",
+    "close": "fa5.window-close",
+    "refresh": "fa5s.sync-alt",
+    "add": "fa5s.plus",
+}
+DEFAULT_SIZE = 24
+# Colors the toolbars start with: qtawesome's own default and TodoWidget's.
+DEFAULT_PALETTE = (None, "black")
+
+
+def get_color_key(color):
+    if not color:
+        return None
+    return QtGui.QColor(color).name(QtGui.QColor.HexArgb)
+
+
+class IconCache(object):
+    def __init__(self, max_size=128):
+        super(IconCache, self).__init__()
+        self.max_size = max_size
+        self.icons = collections.OrderedDict()
+
+    def get(self, name, color=None, size=None):
+        if name not in ICONS:
+            return
+
+        size = size or DEFAULT_SIZE
+        key = (name, get_color_key(color), size)
+        icon = self.icons.get(key)
+        if icon is not None:
+            self.icons.move_to_end(key)
+            return icon
+
+        icon = self.render(name, color, size)
+        self.icons[key] = icon
+        while len(self.icons) > self.max_size:
+            self.icons.popitem(last=False)
+        return icon
+
+    def render(self, name, color, size):
+        if color:
+            source = qtawesome.icon(ICONS[name], color=color)
+        else:
+            source = qtawesome.icon(ICONS[name])
+
+        icon = QtGui.QIcon()
+        # A double size pixmap keeps icons sharp on high dpi screens.
+        for scale in (1, 2):
+            pixmap_size = QtCore.QSize(size * scale, size * scale)
+            for mode in (QtGui.QIcon.Normal, QtGui.QIcon.Disabled):
+                icon.addPixmap(source.pixmap(pixmap_size, mode), mode)
+        return icon
+
+    def prewarm(self, colors=DEFAULT_PALETTE, size=None):
+        for color in colors:
+            for name in ICONS:
+                self.get(name, color=color, size=size)
+
+    def clear(self):
+        self.icons.clear()
+
+
+cache = IconCache()
+
+
+def get_icon(name, color=None, size=None):
+    return cache.get(name, color=color, size=size)
+
+
+def prewarm(colors=DEFAULT_PALETTE, size=None):
+    cache.prewarm(colors, size)
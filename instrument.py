@@ -0,0 +1,196 @@
+"""Counters and timing histograms for the hot paths.
+
+Instrumentation is off unless ``TODO_INSTRUMENT`` is set or ``enable()`` is
+called. Call sites check the module level ``enabled`` flag before doing
+any work, and methods are only wrapped once instrumentation is turned on,
+so a disabled run pays nothing for it.
+"""
+import collections
+import functools
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from todo.version import __version__
+
+enabled = bool(os.environ.get("TODO_INSTRUMENT"))
+
+# Upper bounds of the histogram buckets in milliseconds, the last bucket
+# takes everything slower.
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class Histogram(object):
+    def __init__(self):
+        super(Histogram, self).__init__()
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+        for index, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def report(self):
+        labels = ["<={}ms".format(bound) for bound in BUCKETS]
+        labels.append(">{}ms".format(BUCKETS[-1]))
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 4) if self.count else 0,
+            "max_ms": round(self.max, 3),
+            "buckets": dict(
+                (label, count)
+                for label, count in zip(labels, self.buckets) if count
+            ),
+        }
+
+
+class Registry(object):
+    def __init__(self):
+        super(Registry, self).__init__()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = collections.Counter()
+            self.histograms = collections.defaultdict(Histogram)
+            self.started = time.time()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms[name].add(seconds)
+
+    def report(self):
+        with self.lock:
+            return {
+                "version": __version__,
+                "pid": os.getpid(),
+                "enabled": enabled,
+                "seconds": round(time.time() - self.started, 3),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": dict(
+                    (name, histogram.report())
+                    for name, histogram in sorted(self.histograms.items())
+                ),
+            }
+
+
+registry = Registry()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def count(name, value=1):
+    if enabled:
+        registry.count(name, value)
+
+
+def observe(name, seconds):
+    if enabled:
+        registry.observe(name, seconds)
+
+
+def report():
+    return registry.report()
+
+
+def reset():
+    registry.reset()
+
+
+def wrap(cls, name, metric):
+    """Time every call of ``cls.name`` into the histogram ``metric``.
+
+    ``metric`` is a name, or a function of the call's arguments returning
+    one. Wrapping twice is a no-op.
+    """
+    method = cls.__dict__[name]
+    if getattr(method, "instrumented", False):
+        return
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return method(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            registry.observe(
+                metric(*args) if callable(metric) else metric,
+                time.perf_counter() - started
+            )
+
+    wrapper.instrumented = True
+    setattr(cls, name, wrapper)
+
+
+def trace_statement(statement):
+    if enabled:
+        words = statement.lstrip().split(None, 2)
+        if words and words[0] == "--":
+            # sqlite reports every trigger it runs as "-- TRIGGER name".
+            registry.count("sql.trigger")
+        elif words:
+            registry.count("sql.statements")
+            registry.count("sql.{}".format(words[0].upper()))
+
+
+def trace_connection(connection):
+    connection.set_trace_callback(trace_statement)
+
+
+def get_dump_file():
+    return os.environ.get("TODO_INSTRUMENT_FILE") or os.path.join(
+        tempfile.gettempdir(), "todo-instrument-{}.json".format(os.getpid())
+    )
+
+
+def dump(path=None):
+    path = path or get_dump_file()
+    with open(path, "w") as output:
+        json.dump(report(), output, indent=2)
+        output.write("\n")
+    sys.stderr.write("Instrumentation written to {}\n".format(path))
+    return path
+
+
+def install_signal_handler(schedule):
+    """Dump the report whenever the process gets SIGUSR1.
+
+    The handler can interrupt the main thread while it holds the registry
+    lock, so it only hands ``dump`` to ``schedule``, which has to run it
+    later from the event loop. Python only runs the handler once the
+    interpreter gets control again, which the GUI's timers make sure of
+    within a second or so.
+    """
+    signum = getattr(signal, "SIGUSR1", None)
+    if signum is not None:
+        signal.signal(signum, lambda signum, frame: schedule(dump))
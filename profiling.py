@@ -0,0 +1,95 @@
+"""Startup phase timings for ``todo --profile-startup``."""
+import json
+import sys
+import time
+
+from todo.version import __version__
+
+
+class StartupProfiler(object):
+    def __init__(self):
+        super(StartupProfiler, self).__init__()
+        self.enabled = False
+        self.origin = time.monotonic()
+        self.output = None
+        self.cprofile_output = None
+        self.cprofile = None
+        self.marks = []
+        self._seen = set()
+
+    def enable(self, output=None, cprofile_output=None):
+        self.enabled = True
+        self.output = output
+        self.cprofile_output = cprofile_output
+        if cprofile_output:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def mark(self, phase, timestamp=None):
+        if self.enabled:
+            self.marks.append((phase, (timestamp or time.monotonic())))
+
+    def once(self, phase):
+        if self.enabled and phase not in self._seen:
+            self._seen.add(phase)
+            self.mark(phase)
+
+    def report(self):
+        phases = []
+        previous = self.origin
+        for phase, timestamp in self.marks:
+            phases.append({
+                "phase": phase,
+                "elapsed_ms": round((timestamp - self.origin) * 1000, 3),
+                "delta_ms": round((timestamp - previous) * 1000, 3),
+            })
+            previous = timestamp
+
+        return {
+            "version": __version__,
+            "python": sys.version.split()[0],
+            "phases": phases,
+            "total_ms": phases[-1]["elapsed_ms"] if phases else 0,
+        }
+
+    def dump(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_output)
+            self.cprofile = None
+
+        report = json.dumps(self.report(), indent=2)
+        if not self.output or self.output == "-":
+            sys.stdout.write(report + "\n")
+            sys.stdout.flush()
+        else:
+            with open(self.output, "w") as output:
+                output.write(report + "\n")
+
+
+profiler = StartupProfiler()
+
+
+def install_first_paint_hook(application, widgets, callback):
+    """Call ``callback`` once, after the first paint of one of ``widgets``.
+
+    Paints of anything else, e.g. the splash screen, don't count.
+    """
+    from PyQt5 import QtCore
+
+    widgets = list(widgets)
+
+    class FirstPaintFilter(QtCore.QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QtCore.QEvent.Paint and any(
+                    watched is widget for widget in widgets
+            ):
+                application.removeEventFilter(self)
+                profiler.once("first_paint")
+                QtCore.QTimer.singleShot(0, callback)
+            return False
+
+    paint_filter = FirstPaintFilter(application)
+    application.installEventFilter(paint_filter)
+    return paint_filter
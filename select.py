@@ -1,9 +1,283 @@
 import os
+import json
+import bisect
+import struct
+import threading
 import collections
 from glob import glob
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+from todo import config, utils
+
+# Font files registered with QFontDatabase in this process, {path: font id}.
+_font_ids = {}
+
+# Font maps built in this process, {directory: (font map, font files)}.
+_font_maps = {}
+
+# Families whose styles and sizes were read from QFontDatabase already.
+_loaded_families = set()
+
+# Families Qt registered under another name than the one read from the
+# name table, {family: Qt family}.
+_qt_families = {}
+
+# Preferred name table records, best first:
+# (platform id, encoding id or None for any, language id or None for any).
+_NAME_RECORD_PREFERENCE = [
+    (3, None, 0x409),
+    (3, None, None),
+    (0, None, None),
+    (1, 0, 0),
+]
+
+
+def register_font(path):
+    if path not in _font_ids:
+        _font_ids[path] = QtGui.QFontDatabase.addApplicationFont(path)
+    return _font_ids[path]
+
+
+def find_font_files(directory):
+    extensions = ["*.ttf", "*.otf", "*.ttc"]
+    font_files = []
+
+    for extension in extensions:
+        font_files.extend(glob(os.path.join(directory, extension)))
+        font_files.extend(glob(os.path.join(directory, extension.upper())))
+
+    return sorted(set(font_files))
+
+
+def _decode_name(platform_id, data):
+    if platform_id in (0, 3):
+        return data.decode("utf-16-be", "replace")
+    return data.decode("mac_roman", "replace")
+
+
+def _read_sfnt_names(font_file, offset):
+    font_file.seek(offset)
+    _, table_count = struct.unpack(">4sH", font_file.read(6))
+    font_file.seek(offset + 12)
+    tables = font_file.read(16 * table_count)
+    for index in range(table_count):
+        tag, _, table_offset, _ = struct.unpack(
+            ">4sIII", tables[index * 16:(index + 1) * 16]
+        )
+        if tag == b"name":
+            break
+    else:
+        return {}
+
+    font_file.seek(table_offset)
+    _, count, string_offset = struct.unpack(">HHH", font_file.read(6))
+    records = font_file.read(12 * count)
+    candidates = {}
+    for index in range(count):
+        platform_id, encoding_id, language_id, name_id, length, name_offset = (
+            struct.unpack(">HHHHHH", records[index * 12:(index + 1) * 12])
+        )
+        if name_id not in (1, 2, 16, 17):
+            continue
+        for rank, (platform, encoding, language) in enumerate(
+                _NAME_RECORD_PREFERENCE
+        ):
+            if (
+                    platform == platform_id
+                    and encoding in (None, encoding_id)
+                    and language in (None, language_id)
+            ):
+                if rank < candidates.get(name_id, (len(_NAME_RECORD_PREFERENCE),))[0]:
+                    candidates[name_id] = (
+                        rank, platform_id, table_offset + string_offset + name_offset,
+                        length
+                    )
+                break
+
+    names = {}
+    for name_id, (rank, platform_id, name_offset, length) in candidates.items():
+        font_file.seek(name_offset)
+        names[name_id] = _decode_name(platform_id, font_file.read(length))
+    return names
+
+
+def read_font_families(path):
+    """Read family and style names straight from a font's name table.
+
+    Returns {family: {style: []}}; sizes are only known once the font is
+    registered with QFontDatabase. Works without Qt, so it can run on a
+    worker thread.
+    """
+    families = {}
+    with open(path, "rb") as font_file:
+        if font_file.read(4) == b"ttcf":
+            _, font_count = struct.unpack(">IL", font_file.read(8))
+            offsets = struct.unpack(
+                ">{}L".format(font_count), font_file.read(4 * font_count)
+            )
+        else:
+            offsets = (0,)
+
+        for offset in offsets:
+            names = _read_sfnt_names(font_file, offset)
+            family = names.get(16) or names.get(1)
+            if not family:
+                continue
+            style = names.get(17) or names.get(2) or "Regular"
+            families.setdefault(family, {})[style] = []
+
+    return families
+
+
+def get_font_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime)
+
+
+class FontCatalog(object):
+    """On-disk cache of the families, styles and sizes of font files.
+
+    Entries are keyed by file path and only trusted while the file size and
+    mtime match, so unchanged fonts are neither registered nor scanned.
+    """
+    version = 1
+
+    def __init__(self, path=None):
+        super(FontCatalog, self).__init__()
+        self.path = path or os.path.join(
+            os.environ.get("HOME"), ".config", "todo", "fonts.json"
+        )
+        self.fonts = {}
+        self.dirty = False
+        # The catalog is filled from the scanner thread while the dialog
+        # updates sizes of picked families.
+        self.lock = threading.RLock()
+
+    def load(self):
+        try:
+            with open(self.path) as catalog:
+                data = json.load(catalog)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get("version") == self.version:
+            with self.lock:
+                self.fonts = data.get("fonts", {})
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, mode=0o755)
+            utils.atomic_write(
+                self.path,
+                json.dumps({"version": self.version, "fonts": self.fonts}).encode()
+            )
+            self.dirty = False
+
+    def lookup(self, path, signature):
+        with self.lock:
+            entry = self.fonts.get(path)
+            if entry and (entry["size"], entry["mtime"]) == tuple(signature):
+                return entry["families"]
+
+    def store(self, path, signature, families):
+        size, mtime = signature
+        with self.lock:
+            self.fonts[path] = {
+                "size": size, "mtime": mtime, "families": families
+            }
+            self.dirty = True
+
+    def update_family(self, path, family, styles):
+        with self.lock:
+            entry = self.fonts.get(path)
+            if entry is not None:
+                entry["families"][family] = styles
+                self.dirty = True
+
+    def prune(self, paths):
+        with self.lock:
+            for path in set(self.fonts) - set(paths):
+                del self.fonts[path]
+                self.dirty = True
+
+
+class FontScanner(QtCore.QThread):
+    """Discovers font files and reads their names off the GUI thread.
+
+    Results are emitted in batches of (path, families) as they come in;
+    unchanged files are answered from the catalog without being opened.
+    """
+    scanned = QtCore.pyqtSignal(object)
+    batch_size = 32
+
+    def __init__(self, directory, catalog, parent=None):
+        super(FontScanner, self).__init__(parent)
+        self.directory = directory
+        self.catalog = catalog
+
+    def run(self):
+        self.catalog.load()
+        paths = find_font_files(self.directory)
+        self.catalog.prune(paths)
+
+        batch = []
+        for path in paths:
+            if self.isInterruptionRequested():
+                break
+            try:
+                signature = get_font_signature(path)
+            except OSError:
+                continue
+
+            families = self.catalog.lookup(path, signature)
+            if families is None:
+                try:
+                    families = read_font_families(path)
+                except (IOError, OSError, ValueError, struct.error):
+                    families = {}
+                self.catalog.store(path, signature, families)
+
+            batch.append((path, families))
+            if len(batch) >= self.batch_size:
+                self.scanned.emit(batch)
+                batch = []
+
+        if batch:
+            self.scanned.emit(batch)
+
+
+def save_font_choice(family, style, size, files):
+    configuration = config.Configuration()
+    with configuration.batch():
+        if not configuration.has_section("font"):
+            configuration.add_section("font")
+        configuration.set_section("font", {
+            "family": family,
+            "style": style,
+            "size": size,
+            "files": list(files),
+        })
+
+
+def load_font_choice():
+    configuration = config.Configuration()
+    if not configuration.has_section("font"):
+        return None
+
+    choice = configuration.get_section("font")
+    for path in choice.get("files", []):
+        if os.path.isfile(path):
+            register_font(path)
+    if not choice.get("family"):
+        return None
+    return QtGui.QFontDatabase().font(
+        choice["family"], choice.get("style", ""), int(choice.get("size", 10))
+    )
+
 
 class FontSelector(QtWidgets.QDialog, object):
     def __init__(self, directory):
@@ -11,9 +285,14 @@ class FontSelector(QtWidgets.QDialog, object):
         self.font_dir = directory
         self.font_database = QtGui.QFontDatabase()
         self.font_map = collections.OrderedDict()
+        # {family: [font files]}, registered only once a family is picked.
+        self.font_files = {}
+        self.font_catalog = FontCatalog()
+        self.family_names = []
+        self.scanner = None
         self.selected_font = None
+        self.selected_font_info = None
         self.sample_text = "A quick brown fox."
-        self.build_font_map()
 
         layout = QtWidgets.QGridLayout()
         self.family_list = QtWidgets.QListWidget()
@@ -47,7 +326,7 @@ class FontSelector(QtWidgets.QDialog, object):
         layout.addWidget(self.font_sample, 1, 0, 1, 3)
         layout.addWidget(self.button_box, 2, 2)
         self.setLayout(layout)
-        self.populate_families()
+        self.build_font_map()
 
     def pause_updates(self, pause):
         self.family_list.setUpdatesEnabled(not pause)
@@ -66,18 +345,91 @@ class FontSelector(QtWidgets.QDialog, object):
         self.size_list.clear()
         self.selected_font = None
 
-        self.family_list.addItems(self.font_map.keys())
+        self.family_names = sorted(self.font_map.keys())
+        self.family_list.addItems(self.family_names)
         self.pause_updates(False)
         self.family_list.setCurrentRow(0)
 
+    def add_fonts(self, fonts):
+        new_families = set()
+        for path, families in fonts:
+            for family, styles in families.items():
+                files = self.font_files.setdefault(family, [])
+                if path not in files:
+                    files.append(path)
+                if family not in self.font_map:
+                    self.font_map[family] = {}
+                    new_families.add(family)
+                for style, sizes in styles.items():
+                    if not self.font_map[family].get(style):
+                        self.font_map[family][style] = list(sizes)
+
+        self.family_list.blockSignals(True)
+        for family in sorted(new_families):
+            row = bisect.bisect(self.family_names, family)
+            self.family_names.insert(row, family)
+            self.family_list.insertItem(row, family)
+        self.family_list.blockSignals(False)
+
+        if new_families and self.family_list.currentRow() < 0:
+            self.family_list.setCurrentRow(0)
+
+    def load_family(self, family):
+        """Register a family's files and read its real styles and sizes."""
+        if family in _loaded_families:
+            return
+
+        files = self.font_files.get(family, [])
+        qt_family = self.get_qt_family(family, files)
+        if qt_family is None:
+            return
+        styles = dict(
+            (
+                style,
+                [
+                    str(size) for size in
+                    sorted(self.font_database.smoothSizes(qt_family, style))
+                ]
+            )
+            for style in self.font_database.styles(qt_family)
+        )
+        self.font_map[family] = styles
+        for path in files:
+            self.font_catalog.update_family(path, family, styles)
+        if qt_family != family:
+            _qt_families[family] = qt_family
+        _loaded_families.add(family)
+
+    def get_qt_family(self, family, files):
+        """Return the name Qt knows ``family`` by, None if it has no styles.
+
+        The name table's typographic family (name IDs 16/17) is not always
+        what Qt registers, e.g. GDI goes by name ID 1, so the families Qt
+        reports for the registered files are tried as well.
+        """
+        names = [family]
+        for path in files:
+            font_id = register_font(path)
+            if font_id < 0:
+                continue
+            for name in QtGui.QFontDatabase.applicationFontFamilies(font_id):
+                if name not in names:
+                    names.append(name)
+        for name in names:
+            if self.font_database.styles(name):
+                return name
+
     def populate_styles(self, family_row):
+        if family_row < 0:
+            return
         self.pause_updates(True)
         self.selected_font = None
         self.style_list.clear()
         self.size_list.clear()
 
         family = self.family_list.item(family_row).text()
-        self.style_list.addItems(self.font_map[family].keys())
+        self.load_family(family)
+        self.style_list.addItems(sorted(self.font_map[family].keys()))
         self.pause_updates(False)
         self.style_list.setCurrentRow(0)
 
@@ -89,42 +441,42 @@ class FontSelector(QtWidgets.QDialog, object):
         self.size_list.addItems(self.font_map[family][style])
 
         self.pause_updates(False)
-        self.size_list.setCurrentRow(self.size_list.count()/2.5)
+        self.size_list.setCurrentRow(int(self.size_list.count() / 2.5))
 
     def update_sample(self):
         family = self.family_list.item(self.family_list.currentRow()).text()
         style = self.style_list.item(self.style_list.currentRow()).text()
         size = int(self.size_list.item(self.size_list.currentRow()).text())
+        files = self.font_files.get(family, [])
+        for path in files:
+            register_font(path)
+        family = _qt_families.get(family, family)
         self.selected_font = self.font_database.font(family, style, size)
+        self.selected_font_info = (family, style, size, files)
         self.font_sample.setText(self.sample_text)
         self.font_sample.setFont(self.selected_font)
 
     def get_font_files(self):
-        extensions = ["*.ttf", "*.otf"]
-        font_files = []
-
-        for extension in extensions:
-            font_files.extend(glob(os.path.join(self.font_dir, extension)))
-            font_files.extend(
-                glob(os.path.join(self.font_dir, extension.upper()))
-            )
-
-        return font_files
+        return find_font_files(self.font_dir)
 
     def build_font_map(self):
-        font_ids = map(
-            self.font_database.addApplicationFont,
-            self.get_font_files()
-        )
+        cached = _font_maps.get(self.font_dir)
+        if cached is not None:
+            self.font_map, self.font_files = cached
+            self.populate_families()
+        else:
+            _font_maps[self.font_dir] = (self.font_map, self.font_files)
 
-        for font_id in font_ids:
-            for family in sorted(
-                self.font_database.applicationFontFamilies(font_id)
-            ):
-                self.font_map.setdefault(family, {})
-                for style in sorted(self.font_database.styles(family)):
-                    self.font_map[family].setdefault(style, [])
-                    self.font_map[family][style] = map(
-                        str,
-                        sorted(self.font_database.smoothSizes(family, style))
-                    )
+        # Even a cached map is revalidated in the background, so fonts added
+        # or changed since show up without reopening the dialog.
+        self.scanner = FontScanner(self.font_dir, self.font_catalog, self)
+        self.scanner.scanned.connect(self.add_fonts)
+        self.scanner.finished.connect(self.font_catalog.save)
+        self.scanner.start()
+
+    def done(self, result):
+        if self.scanner is not None and self.scanner.isRunning():
+            self.scanner.requestInterruption()
+            self.scanner.wait()
+        self.font_catalog.save()
+        super(FontSelector, self).done(result)
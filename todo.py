@@ -1,34 +1,29 @@
-import os
+import collections
 import functools
-import sqlite3
-import random
 import inspect
+import queue
+import sqlite3
 import sys
+import threading
+import time
 
 from PyQt5 import QtCore, QtGui, QtSql, QtWidgets
-import qtawesome
 
-from todo import utils, constant
+from todo import icons, instrument, utils, constant, database
+from todo.profiling import profiler
 
 
 class TodoWidget(QtWidgets.QDialog, object):
+    # Emitted with a message the user has to see, e.g. a lost edit.
+    status_message = QtCore.pyqtSignal(str)
+
     def __init__(self):
         super(TodoWidget, self).__init__()
-        self.priorities = dict((
-            (1, "Today"),
-            (2, "Later"),
-            (3, "Sometime"),
-            (4, "Someday")
-        ))
-
-        # Item lifespans in seconds.
-        # {priority: (active lifespan, completed lifespan)}
-        self.lifespans = dict((
-            (1, (8 * 60 * 60, 5 * 60)),
-            (2, (12 * 60 * 60, 5 * 60)),
-            (3, (5 * 24 * 60 * 60, 5 * 60)),
-            (4, (None, 5 * 60))
-        ))
+        self.priorities = dict(constant.PRIORITIES)
+        self.lifespans = dict(constant.LIFESPANS)
+        self.sweeper = TodoLifespanSweeper.instance(self.lifespans)
+        self.sweeper.start()
+        TodoExternalChangeWatcher.instance().start()
         self.default_size = QtCore.QSize(600, 350)
         self._current_font = self.font()
         self._current_font_color = "black"
@@ -75,17 +70,18 @@ class TodoWidget(QtWidgets.QDialog, object):
         self.setFixedSize(self.default_size)
 
     def get_icon(self, name, color=None):
-        iconmap = {
-            "refresh": "fa5s.sync-alt",
-            "add": "fa5s.plus"
-        }
+        return icons.get_icon(name, color=color)
 
-        if name not in iconmap:
-            return
-        if color:
-            return qtawesome.icon(iconmap[name], color=color)
-        else:
-            return qtawesome.icon(iconmap[name])
+    def add_view(self, view):
+        view.model().current_font = self._current_font
+        view.model().current_font_color = self._current_font_color
+        view.model().write_failed.connect(self.report_write_failure)
+        self.views[view.priority] = view
+
+    def report_write_failure(self, ids, error):
+        self.status_message.emit(
+            "Could not save changes to {} todo(s): {}".format(len(ids), error)
+        )
 
     @property
     def current_view(self):
@@ -119,8 +115,6 @@ class TodoWidget(QtWidgets.QDialog, object):
             action.setIcon(self.get_icon(name, color=color))
 
     def add(self):
-        if constant.DEBUG:
-            print("Adding entry...")
         title, ok = QtWidgets.QInputDialog.getText(
             self, "Add todo", "What would you like to do?"
         )
@@ -129,15 +123,12 @@ class TodoWidget(QtWidgets.QDialog, object):
             return
 
         title = str(title).strip()
-        timestamp = utils.get_timestamp()
+        timestamp = database.get_timestamp()
         item = {
             "title": title,
             "timestamp": timestamp,
         }
 
-        if constant.DEBUG:
-            print("add(), title: {}, timestamp: {}, item: {}".format(title, timestamp, item))
-
         self.current_view.model().add_entry(item)
 
 
@@ -147,20 +138,54 @@ class TodoDeskWidget(TodoWidget):
 
         self.stack = QtWidgets.QTabWidget()
         self.views = {}
+        self.search_field = QtWidgets.QLineEdit()
+        self.search_field.setPlaceholderText("Search")
+        self.search_field.setClearButtonEnabled(True)
+        self.toolbar.addWidget(self.search_field)
+        self.search_view = TodoSearchView(self.priorities, self)
+        self.search_view.hide()
         self.layout().addWidget(self.toolbar, 0, 0)
         self.layout().addWidget(self.stack, 1, 0, 1, 2)
+        self.layout().addWidget(self.search_view, 1, 0, 1, 2)
 
+        # Views are only built, and their models selected, once their tab
+        # is shown for the first time.
         for priority, label in self.priorities.items():
-            view = TodoView(priority, self.lifespans[priority], self)
-            self.views[priority] = view
-            self.stack.addTab(view, label)
-            view.viewchanged.connect(self.refresh)
+            page = QtWidgets.QWidget()
+            page.setLayout(QtWidgets.QVBoxLayout())
+            page.layout().setContentsMargins(0, 0, 0, 0)
+            self.stack.addTab(page, label)
+        self.stack.currentChanged.connect(self.ensure_view)
+        self.search_field.textChanged.connect(self.search)
+        self.search_view.entry_activated.connect(self.show_entry)
         self.current_font = self._current_font
         self.current_font_color = self._current_font_color
+        self.ensure_view(self.stack.currentIndex())
+
+    def ensure_view(self, index):
+        priority = list(self.priorities.keys())[index]
+        view = self.views.get(priority)
+        if view is None:
+            view = TodoView(priority, self.lifespans[priority], self)
+            self.add_view(view)
+            self.stack.widget(index).layout().addWidget(view)
+        return view
 
     @property
     def current_view(self):
-        return self.views[self.stack.currentIndex() + 1]
+        return self.ensure_view(self.stack.currentIndex())
+
+    def search(self, text):
+        searching = bool(text.strip())
+        self.stack.setVisible(not searching)
+        self.search_view.setVisible(searching)
+        self.search_view.search(text)
+
+    def show_entry(self, id, priority):
+        self.search_field.clear()
+        index = list(self.priorities.keys()).index(priority)
+        self.stack.setCurrentIndex(index)
+        self.ensure_view(index).select_id(id)
 
 
 class TodoDockWidget(TodoWidget):
@@ -168,23 +193,29 @@ class TodoDockWidget(TodoWidget):
         super(TodoDockWidget, self).__init__()
         self.default_size = QtCore.QSize(600, 50)
         self.priority = list(self.priorities.keys())[0]
-        view = TodoView(self.priority, self.lifespans[self.priority], self)
-        self.views[self.priority] = view
-        view.viewchanged.connect(self.refresh)
-        self.layout().addWidget(view, 0, 0)
+        # The view is only built, and its model selected, once docked.
         self.layout().addWidget(self.toolbar, 0, 1)
         self.layout().setColumnStretch(0, 575)
         self.setFixedSize(self.default_size)
         self.current_font = self._current_font
         self.current_font_color = self._current_font_color
 
+    def ensure_view(self):
+        view = self.views.get(self.priority)
+        if view is None:
+            view = TodoView(self.priority, self.lifespans[self.priority], self)
+            self.add_view(view)
+            self.layout().addWidget(view, 0, 0)
+        return view
+
     @property
     def current_view(self):
-        return self.views[self.priority]
+        return self.ensure_view()
 
 
 class TodoView(QtWidgets.QTableView, object):
-    viewchanged = QtCore.pyqtSignal()
+    # Rows considered when sizing columns to their contents.
+    resize_sample = 100
 
     def __init__(self, priority, lifespans, container):
         super(TodoView, self).__init__()
@@ -192,19 +223,31 @@ class TodoView(QtWidgets.QTableView, object):
         self.container = container
         self.lifespans = lifespans
         self.priority = priority
-
-        self.database = QtSql.QSqlDatabase.addDatabase("QSQLITE")
-        self.database.setDatabaseName(os.path.join(os.environ.get("HOME"), ".config", "todo", ".config"))
-        self.database.open()
-
-        model = TodoModel(self.database, priority, lifespans)
+        self.pending_select_id = None
+
+        # Priorities without an active lifespan grow without bound, so they
+        # are loaded page by page.
+        model = TodoModel(
+            priority,
+            lifespans,
+            paged=lifespans[0] is None,
+            write_behind=constant.WRITE_BEHIND,
+            async_select=constant.ASYNC_SELECT
+        )
         self.setModel(model)
+        model.rows_loaded.connect(self.select_pending)
+        self.item_delegate = TodoItemDelegate(self)
+        for column in (
+                model.completed_column, model.title_column, model.timestamp_column
+        ):
+            self.setItemDelegateForColumn(column, self.item_delegate)
         self.setAlternatingRowColors(True)
         self.setShowGrid(False)
         self.setSortingEnabled(False)
         self.setCornerButtonEnabled(True)
         self.setSelectionMode(QtWidgets.QTableView.ExtendedSelection)
         self.setSelectionBehavior(QtWidgets.QTableView.SelectRows)
+        self.horizontalHeader().setResizeContentsPrecision(self.resize_sample)
         self.resizeColumnsToContents()
         self.horizontalHeader().setStretchLastSection(True)
 
@@ -214,15 +257,33 @@ class TodoView(QtWidgets.QTableView, object):
 
         self.hideColumn(0)
         self.hideColumn(len(self.model().fields()) - 1)
-        self.model().datachanged.connect(self.viewchanged.emit)
 
         self.horizontalHeader().hide()
         self.verticalHeader().hide()
+        profiler.mark("view:{}".format(priority))
 
     def selectedRecords(self):
         rows = set([index.row() for index in self.selectedIndexes()])
         return map(lambda row: (row, self.model().get_record(row)), rows)
 
+    def selectedIds(self):
+        rows = set([index.row() for index in self.selectedIndexes()])
+        return [self.model().id_for_row(row) for row in sorted(rows)]
+
+    def select_id(self, id):
+        row = self.model().load_row(id)
+        self.pending_select_id = None
+        if row is not None:
+            self.selectRow(row)
+            self.scrollTo(self.model().index(row, self.model().title_column))
+        elif self.model().queries:
+            # Still loading, try again once the rows are in.
+            self.pending_select_id = id
+
+    def select_pending(self):
+        if self.pending_select_id is not None:
+            self.select_id(self.pending_select_id)
+
     def context_menu(self):
         self.menu.clear()
         promote_action = QtWidgets.QAction("Promote", self)
@@ -231,37 +292,19 @@ class TodoView(QtWidgets.QTableView, object):
         mark_active_action = QtWidgets.QAction("Mark active", self)
 
         def mark_complete():
-            for row, record in self.selectedRecords():
-                record.setValue(self.model().completed_column, 1)
-                self.model().updateRowInTable(row, record)
-                self.model().submit()
+            self.model().mark_entries(self.selectedIds(), True)
 
         def mark_active():
-            for row, record in self.selectedRecords():
-                record.setValue(self.model().completed_column, 0)
-                self.model().updateRowInTable(row, record)
-                self.model().submit()
+            self.model().mark_entries(self.selectedIds(), False)
 
         def promote():
-            for row, record in self.selectedRecords():
-                column = self.model().priority_column
-                record.setValue(column, record.value(column) - 1)
-                self.model().updateRowInTable(row, record)
-                self.model().submit()
+            self.model().move_entries(self.selectedIds(), self.priority - 1)
 
         def demote():
-            for row, record in self.selectedRecords():
-                column = self.model().priority_column
-                record.setValue(column, record.value(column) + 1)
-                self.model().updateRowInTable(row, record)
-                self.model().submit()
+            self.model().move_entries(self.selectedIds(), self.priority + 1)
 
         def move(priority):
-            for row, record in self.selectedRecords():
-                column = self.model().priority_column
-                record.setValue(column, priority)
-                self.model().updateRowInTable(row, record)
-                self.model().submit()
+            self.model().move_entries(self.selectedIds(), priority)
 
         mark_complete_action.triggered.connect(mark_complete)
         mark_active_action.triggered.connect(mark_active)
@@ -292,149 +335,684 @@ class TodoView(QtWidgets.QTableView, object):
         self.context_menu().popup(QtGui.QCursor.pos())
 
 
-class TodoDatabaseManager(object):
-    def __init__(self):
-        self.__dbname__ = "config"
-        self.__dbdir__ = os.path.join(
-            os.environ.get("HOME"), ".config", "todo"
+TodoRowState = collections.namedtuple(
+    "TodoRowState", ("id", "completed", "priority", "timestamp")
+)
+
+# Everything TodoItemDelegate needs to paint a row, fetched in one call.
+TodoRowRender = collections.namedtuple(
+    "TodoRowRender", ("completed", "title", "timestamp", "font", "color")
+)
+
+
+class TodoItemDelegate(QtWidgets.QStyledItemDelegate):
+    """Paints the completed, title and timestamp columns from one render
+    tuple per row instead of asking the model for every role of every cell.
+    """
+    elide_cache_size = 4096
+
+    def __init__(self, parent=None):
+        super(TodoItemDelegate, self).__init__(parent)
+        self.metrics = {}
+        self.strike_out_fonts = {}
+        self.elided = collections.OrderedDict()
+
+    def get_font(self, option, render):
+        font = render.font or option.font
+        if render.completed and not font.strikeOut():
+            key = font.key()
+            if key not in self.strike_out_fonts:
+                strike_out_font = QtGui.QFont(font)
+                strike_out_font.setStrikeOut(True)
+                self.strike_out_fonts[key] = strike_out_font
+            font = self.strike_out_fonts[key]
+        return font
+
+    def get_metrics(self, font):
+        key = font.key()
+        metrics = self.metrics.get(key)
+        if metrics is None:
+            metrics = self.metrics[key] = QtGui.QFontMetrics(font)
+        return metrics
+
+    def elide(self, text, font, width):
+        key = (text, font.key(), width)
+        elided = self.elided.get(key)
+        if elided is not None:
+            self.elided.move_to_end(key)
+            return elided
+
+        elided = self.get_metrics(font).elidedText(
+            text, QtCore.Qt.ElideRight, width
         )
-        self.__dbfile__ = os.path.join(self.__dbdir__, self.__dbname__)
-
-        if not os.path.isdir(self.__dbdir__):
-            os.makedirs(self.__dbdir__, mode=755)
-
-        self.connection_name = u"todo_sql_connection"
-        self.table = u"todos"
-        self.connection = sqlite3.connect(self.__dbfile__)
-        self.connection.row_factory = sqlite3.Row
-        self.session = self.connection.cursor()
-
-        if self.table not in self.tables:
-            command = """CREATE TABLE {} (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, {})""".format(
-                self.table,
-                ", ".join(
-                    "{} {}".format(field, datatype)
-                    for field, datatype in self.fields
-                )
+        self.elided[key] = elided
+        if len(self.elided) > self.elide_cache_size:
+            self.elided.popitem(last=False)
+        return elided
+
+    def get_text(self, model, column, render):
+        if column == model.title_column:
+            return render.title
+        if render.timestamp is not None:
+            return model.timestamp_cache.humanize(render.timestamp)
+        return ""
+
+    def get_style(self, option):
+        widget = option.widget
+        return widget.style() if widget else QtWidgets.QApplication.style()
+
+    def get_margin(self, style, option):
+        return style.pixelMetric(
+            QtWidgets.QStyle.PM_FocusFrameHMargin, None, option.widget
+        ) + 1
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        column = index.column()
+        render = model.row_render(index.row())
+        style = self.get_style(option)
+        option = QtWidgets.QStyleOptionViewItem(option)
+
+        painter.save()
+        style.drawPrimitive(
+            QtWidgets.QStyle.PE_PanelItemViewItem, option, painter, option.widget
+        )
+
+        if column == model.completed_column:
+            # Same place the default delegate puts it, so clicks still toggle.
+            option.features |= QtWidgets.QStyleOptionViewItem.HasCheckIndicator
+            option.rect = style.subElementRect(
+                QtWidgets.QStyle.SE_ItemViewItemCheckIndicator,
+                option,
+                option.widget
+            )
+            option.state &= ~(
+                QtWidgets.QStyle.State_On | QtWidgets.QStyle.State_Off
+            )
+            option.state |= (
+                QtWidgets.QStyle.State_On
+                if render.completed else QtWidgets.QStyle.State_Off
+            )
+            style.drawPrimitive(
+                QtWidgets.QStyle.PE_IndicatorItemViewItemCheck,
+                option,
+                painter,
+                option.widget
+            )
+        else:
+            font = self.get_font(option, render)
+            if option.state & QtWidgets.QStyle.State_Selected:
+                color = option.palette.color(QtGui.QPalette.HighlightedText)
+            else:
+                color = render.color or option.palette.color(QtGui.QPalette.Text)
+            margin = self.get_margin(style, option)
+            rect = option.rect.adjusted(margin, 0, -margin, 0)
+            painter.setFont(font)
+            painter.setPen(color)
+            painter.drawText(
+                rect,
+                QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter,
+                self.elide(self.get_text(model, column, render), font, rect.width())
             )
-            self.session.execute(command)
-            self.connection.commit()
 
-        # if not self.session.execute(
-        #     """select COUNT(*) from {}""".format(self.table)
-        # ).fetchone()[0]:
-        #     self.populate_test_data(5)
+        painter.restore()
 
-    @property
-    def fields(self):
-        return [
-            ("completed", "INTEGER"),
-            ("title", "TEXT"),
-            ("timestamp", "TEXT"),
-            ("priority", "INTEGER"),
-        ]
+    def sizeHint(self, option, index):
+        model = index.model()
+        column = index.column()
+        render = model.row_render(index.row())
+        style = self.get_style(option)
+        margin = self.get_margin(style, option)
 
-    @property
-    def tables(self):
-        return [
-            row["name"] for row in self.session.execute(
-                "select name from sqlite_master where type = 'table'"
-            ).fetchall()
-        ]
+        if column == model.completed_column:
+            width = style.pixelMetric(
+                QtWidgets.QStyle.PM_IndicatorWidth, None, option.widget
+            )
+            height = style.pixelMetric(
+                QtWidgets.QStyle.PM_IndicatorHeight, None, option.widget
+            )
+            return QtCore.QSize(width + 2 * margin, height)
 
-    @property
-    def table_info(self):
-        return self.session.execute(
-            "PRAGMA TABLE_INFO({})".format(self.table)
-        ).fetchall()
-
-    def get_connection(self, connection_name=None):
-        self.connection_name = connection_name or self.connection_name
-        if QtSql.QSqlDatabase.contains(self.connection_name):
-            return QtSql.QSqlDatabase.database(self.connection_name)
-
-        database = QtSql.QSqlDatabase.addDatabase(
-            "QSQLITE", self.connection_name
+        metrics = self.get_metrics(self.get_font(option, render))
+        return QtCore.QSize(
+            metrics.width(self.get_text(model, column, render)) + 2 * margin,
+            metrics.height()
         )
-        database.setDatabaseName(self.__dbfile__)
-        database.open()
-
-        return database
-
-    def add_entry(self, data):
-        if constant.DEBUG:
-            print("add_entry(), data: {}".format(data))
-        command = (
-            """
-            INSERT INTO todos({}) VALUES ("{completed},"{title}", "{timestamp}, {priority})
-            """.format(
-                ", ".join([field for field, datatype in self.fields]),
-                **data
-            )
+
+
+class TodoChange(object):
+    def __init__(self, ids=None, priorities=None, removed=False, source=None):
+        self.ids = frozenset(ids or ())
+        self.priorities = frozenset(priorities or ())
+        self.removed = removed
+        # The model that already applied this change to itself, if any.
+        self.source = source
+
+    def affects(self, priority):
+        return not self.priorities or priority in self.priorities
+
+    def __repr__(self):
+        return "TodoChange(ids={}, priorities={}, removed={})".format(
+            sorted(self.ids), sorted(self.priorities), self.removed
         )
-        if constant.DEBUG:
-            print(command)
-        self.session.execute(command, data)
-        self.connection.commit()
-        return True
 
-    def remove_entry(self, data):
-        command = (
-            """
-            DELETE FROM {} WHERE id = {} 
-            """.format(self.table, data["id"])
+
+class TodoChangeBus(QtCore.QObject):
+    changed = QtCore.pyqtSignal(object)
+    _shared = None
+
+    @classmethod
+    def instance(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def publish(self, ids=None, priorities=None, removed=False, source=None):
+        change = TodoChange(ids, priorities, removed, source)
+        instrument.count("bus.publish")
+        self.changed.emit(change)
+        return change
+
+
+TodoWrite = collections.namedtuple("TodoWrite", ("ids", "changes", "source"))
+
+
+class TodoWriteBehind(QtCore.QThread):
+    """Commits queued edits off the GUI thread.
+
+    Writes arriving within ``commit_delay`` seconds of each other are
+    grouped into one transaction. If a group fails its writes are retried
+    one by one, so only the offending ones are reported as failed.
+    """
+    committed = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object, str)
+    _shared = None
+    commit_delay = 0.005
+
+    def __init__(self, registry=None, parent=None):
+        super(TodoWriteBehind, self).__init__(parent)
+        self.registry = registry or TodoConnectionRegistry.instance()
+        self.queue = queue.Queue()
+        self.committed.connect(self.finish_writes)
+        self.failed.connect(self.roll_back_writes)
+
+    @classmethod
+    def instance(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+            application = QtCore.QCoreApplication.instance()
+            if application is not None:
+                application.aboutToQuit.connect(cls._shared.stop)
+            cls._shared.start()
+        return cls._shared
+
+    def submit(self, write):
+        self.queue.put(write)
+
+    def stop(self):
+        """Commit everything still queued and end the thread."""
+        if self.isRunning():
+            self.queue.put(None)
+            self.wait()
+
+    def next_group(self):
+        writes = [self.queue.get()]
+        deadline = time.monotonic() + self.commit_delay
+        while writes[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                writes.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return writes
+
+    def commit(self, connection, writes):
+        with database.transaction(connection):
+            for write in writes:
+                database.update_rows(connection, write.ids, write.changes)
+
+    def run(self):
+        connection = self.registry.connection()
+        running = True
+        while running:
+            writes = self.next_group()
+            if writes[-1] is None:
+                running = False
+                writes.pop()
+            if not writes:
+                continue
+
+            try:
+                self.commit(connection, writes)
+            except sqlite3.Error:
+                for write in writes:
+                    try:
+                        self.commit(connection, [write])
+                    except sqlite3.Error as error:
+                        self.failed.emit([write], str(error))
+                    else:
+                        self.committed.emit([write])
+            else:
+                self.committed.emit(writes)
+
+        self.registry.close()
+
+    def finish_writes(self, writes):
+        for write in writes:
+            write.source.finish_write(write)
+
+    def roll_back_writes(self, writes, error):
+        for write in writes:
+            write.source.roll_back_write(write, error)
+
+
+class TodoQuerySignals(QtCore.QObject):
+    # (generation, rows)
+    rows_ready = QtCore.pyqtSignal(int, object)
+    # (generation, error or "")
+    finished = QtCore.pyqtSignal(int, str)
+
+
+class TodoQuery(QtCore.QRunnable):
+    """Reads the rows of one priority on a pool thread, batch by batch.
+
+    Every pool thread keeps its own connection from the registry. A query
+    stops between batches once cancelled by a newer one.
+    """
+    _pool = None
+
+    def __init__(self, registry, priority, generation, batch_size=None):
+        super(TodoQuery, self).__init__()
+        self.setAutoDelete(False)
+        self.registry = registry
+        self.priority = priority
+        self.generation = generation
+        self.batch_size = batch_size or 500
+        self.cancelled = threading.Event()
+        self.signals = TodoQuerySignals()
+
+    @classmethod
+    def pool(cls):
+        if cls._pool is None:
+            cls._pool = QtCore.QThreadPool()
+            cls._pool.setMaxThreadCount(2)
+            # Pool threads, and the connections they hold, live for good.
+            cls._pool.setExpiryTimeout(-1)
+        return cls._pool
+
+    def start(self):
+        self.pool().start(self)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        error = ""
+        try:
+            if not self.cancelled.is_set():
+                for rows in database.iter_rows(
+                        self.registry.connection(), self.priority, self.batch_size
+                ):
+                    if self.cancelled.is_set():
+                        break
+                    self.signals.rows_ready.emit(self.generation, rows)
+        except sqlite3.Error as exception:
+            error = str(exception)
+        self.signals.finished.emit(self.generation, error)
+
+
+class TodoSearchView(QtWidgets.QListWidget, object):
+    entry_activated = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, priorities, parent=None, delay=None, limit=None):
+        super(TodoSearchView, self).__init__(parent)
+        self.priorities = priorities
+        self.database_manager = TodoDatabaseManager()
+        self.limit = limit or 500
+        self.text = ""
+        self.results = None
+
+        # Wait for typing to settle before querying, then stream the
+        # results in batches from the event loop.
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(delay or 150)
+        self.debounce_timer.timeout.connect(self.start_search)
+        self.stream_timer = QtCore.QTimer(self)
+        self.stream_timer.setInterval(0)
+        self.stream_timer.timeout.connect(self.fetch_results)
+
+        self.itemActivated.connect(self.activate_item)
+
+    def search(self, text):
+        self.text = text
+        self.stop_search()
+        self.debounce_timer.start()
+
+    def stop_search(self):
+        self.stream_timer.stop()
+        if self.results is not None:
+            # Closing the generator releases its cursor.
+            self.results.close()
+            self.results = None
+
+    def start_search(self):
+        self.clear()
+        self.results = self.database_manager.search(self.text)
+        self.stream_timer.start()
+
+    def fetch_results(self):
+        batch = next(self.results, None) if self.results is not None else None
+        if batch is None:
+            self.stop_search()
+            return
+
+        for id, completed, title, timestamp, priority in batch:
+            item = QtWidgets.QListWidgetItem(title)
+            item.setData(QtCore.Qt.UserRole, (id, priority))
+            item.setToolTip(self.priorities.get(priority, ""))
+            if completed:
+                font = item.font()
+                font.setStrikeOut(True)
+                item.setFont(font)
+            self.addItem(item)
+
+        if self.count() >= self.limit:
+            self.stop_search()
+
+    def activate_item(self, item):
+        id, priority = item.data(QtCore.Qt.UserRole)
+        self.entry_activated.emit(id, priority)
+
+
+class TodoSweepSignals(QtCore.QObject):
+    # (changed priorities, free pages, error or "")
+    finished = QtCore.pyqtSignal(object, int, str)
+
+
+class TodoSweep(QtCore.QRunnable):
+    """Archives and demotes expired todos on a pool thread."""
+
+    def __init__(self, registry, lifespans):
+        super(TodoSweep, self).__init__()
+        self.setAutoDelete(False)
+        self.registry = registry
+        self.lifespans = lifespans
+        self.signals = TodoSweepSignals()
+
+    def run(self):
+        priorities = set()
+        free_pages = 0
+        error = ""
+        try:
+            database_manager = database.TodoDatabase(self.registry)
+            priorities = database_manager.process_lifespans(self.lifespans)
+            database_manager.prune_changes()
+            free_pages = database_manager.free_pages()
+        except sqlite3.Error as exception:
+            error = str(exception)
+        self.signals.finished.emit(priorities, free_pages, error)
+
+
+class TodoVacuumSignals(QtCore.QObject):
+    # (free pages left, error or "")
+    finished = QtCore.pyqtSignal(int, str)
+
+
+class TodoVacuum(QtCore.QRunnable):
+    """Gives free pages back to the file system on a pool thread."""
+
+    def __init__(self, registry, pages):
+        super(TodoVacuum, self).__init__()
+        self.setAutoDelete(False)
+        self.registry = registry
+        self.pages = pages
+        self.signals = TodoVacuumSignals()
+
+    def run(self):
+        free_pages = 0
+        error = ""
+        try:
+            database_manager = database.TodoDatabase(self.registry)
+            free_pages = database_manager.vacuum(self.pages)
+        except sqlite3.Error as exception:
+            error = str(exception)
+        self.signals.finished.emit(free_pages, error)
+
+
+class TodoLifespanSweeper(QtCore.QObject):
+    """Archives and demotes expired todos, then gives freed pages back.
+
+    There is one sweeper per process. Sweeps run as TodoSweep on the query
+    pool, the first one once the event loop is up. The incremental vacuum
+    runs as TodoVacuum in small passes, each started from a zero timeout
+    timer, which Qt only fires once pending events are handled, so it
+    fills idle time instead of competing with input. The first pass also
+    switches an older file to incremental mode.
+    """
+    vacuum_pages = database.VACUUM_PAGES
+    _shared = None
+
+    def __init__(self, lifespans, interval=None, parent=None):
+        super(TodoLifespanSweeper, self).__init__(parent)
+        self.lifespans = lifespans
+        self.database_manager = TodoDatabaseManager()
+        self.current_sweep = None
+        self.current_vacuum = None
+        self.vacuumed = False
+        self.timer = QtCore.QTimer(self)
+        # Sweep interval in milliseconds.
+        self.timer.setInterval(interval or 60 * 1000)
+        self.timer.timeout.connect(self.sweep)
+        self.vacuum_timer = QtCore.QTimer(self)
+        self.vacuum_timer.setSingleShot(True)
+        self.vacuum_timer.setInterval(0)
+        self.vacuum_timer.timeout.connect(self.vacuum)
+
+    @classmethod
+    def instance(cls, lifespans):
+        if cls._shared is None:
+            cls._shared = cls(lifespans)
+        return cls._shared
+
+    def start(self):
+        if not self.timer.isActive():
+            self.timer.start()
+            QtCore.QTimer.singleShot(0, self.sweep)
+
+    def stop(self):
+        self.timer.stop()
+        self.vacuum_timer.stop()
+
+    def sweep(self):
+        if self.current_sweep is not None:
+            return
+        self.current_sweep = TodoSweep(
+            self.database_manager.registry, self.lifespans
         )
-        if constant.DEBUG:
-            print(command)
-        self.session.execute(command)
-        self.connection.commit()
-
-    def update_entry(self, data):
-        command = (
-            """0
-            UPDATE {} SET {} WHERE id = {}
-            """.format(
-                self.table,
-                ", ".join([
-                    "{} = '{}'".format(field, value)
-                    for field, value in data.items()
-                    if value is not None and field != "id"
-                ]),
-                data["id"]
+        self.current_sweep.signals.finished.connect(self.finish_sweep)
+        TodoQuery.pool().start(self.current_sweep)
+
+    def finish_sweep(self, priorities, free_pages, error):
+        self.current_sweep = None
+        if error:
+            # Usually locked by someone else, the next sweep tries again.
+            print("Sweeping expired todos failed: {}".format(error))
+        if priorities:
+            TodoChangeBus.instance().publish(
+                priorities=priorities, removed=True
             )
+        if (free_pages or not self.vacuumed) and self.timer.isActive():
+            self.vacuum_timer.start()
+
+    def vacuum(self):
+        if self.current_vacuum is not None:
+            return
+        self.current_vacuum = TodoVacuum(
+            self.database_manager.registry, self.vacuum_pages
         )
-        if constant.DEBUG:
-            print(command)
-        self.session.execute(command)
-        self.connection.commit()
-        return True
+        self.current_vacuum.signals.finished.connect(self.finish_vacuum)
+        TodoQuery.pool().start(self.current_vacuum)
 
-    def populate_test_data(self, count=None):
-        priorities = range(1, 5)
-        for index in range(1, (count or 20) + 1):
-            command = (
-                """
-                INSERT INTO todos({}) VALUES ({}, "test todo {}", "{}", {})
-                """.format(
-                    ", ".join([field for field, datatype in self.fields]),
-                    random.choice([0, 1]),
-                    index,
-                    utils.get_timestamp(),
-                    random.choice(priorities)
-                )
-            )
-            self.session.execute(command)
-        self.connection.commit()
+    def finish_vacuum(self, free_pages, error):
+        self.current_vacuum = None
+        if error:
+            # Locked by someone else, the next sweep tries again.
+            return
+        self.vacuumed = True
+        if free_pages and self.timer.isActive():
+            self.vacuum_timer.start()
 
 
-class TodoModel(QtSql.QSqlTableModel):
-    datachanged = QtCore.pyqtSignal()
+class TodoExternalChangeWatcher(QtCore.QObject):
+    """Notices commits made by other connections and processes.
 
-    def __init__(self, database, priority, lifespans):
-        super(TodoModel, self).__init__(None, database)
+    PRAGMA data_version only moves when another connection commits, so
+    polling it is cheap. When it moves, the per-priority revisions tell
+    which models have to refresh, and the change log which todos.
+    """
+    # Revisions read from the change log per priority, past that models
+    # reload the priority anyway.
+    change_limit = 64
+    _shared = None
+
+    def __init__(self, interval=None, parent=None):
+        super(TodoExternalChangeWatcher, self).__init__(parent)
         self.database_manager = TodoDatabaseManager()
+        self.data_version = None
+        self.revisions = {}
+        self.timer = QtCore.QTimer(self)
+        # Poll interval in milliseconds.
+        self.timer.setInterval(interval or 1000)
+        self.timer.timeout.connect(self.poll)
+        TodoChangeBus.instance().changed.connect(self.sync)
+
+    @classmethod
+    def instance(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def start(self):
+        if not self.timer.isActive():
+            self.sync()
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def sync(self, change=None):
+        # Changes published in this process are already being applied, so
+        # only remember where they left the database.
+        self.data_version = self.database_manager.data_version()
+        self.revisions = self.database_manager.revisions()
+
+    def poll(self):
+        data_version = self.database_manager.data_version()
+        if data_version == self.data_version:
+            return
+
+        self.data_version = data_version
+        revisions = self.database_manager.revisions()
+        ids = set()
+        patched, reloaded = [], []
+        for priority in set(revisions) | set(self.revisions):
+            revision = self.revisions.get(priority, 0)
+            if revisions.get(priority, 0) == revision:
+                continue
+            changes = None
+            if revisions.get(priority, 0) - revision <= self.change_limit:
+                changes = self.database_manager.changes(priority, revision)
+            if changes is None:
+                reloaded.append(priority)
+            else:
+                patched.append(priority)
+                ids |= changes
+        self.revisions = revisions
+        if patched:
+            TodoChangeBus.instance().publish(ids=ids, priorities=patched)
+        if reloaded:
+            TodoChangeBus.instance().publish(
+                priorities=reloaded, removed=True
+            )
+
+
+class TodoConnectionRegistry(database.ConnectionRegistry):
+    connection_name = u"todo_sql_connection"
+
+    def qt_connection_name(self):
+        thread = threading.current_thread()
+        if thread is threading.main_thread():
+            return self.connection_name
+        return u"{}_{}".format(self.connection_name, thread.ident)
+
+    def qt_connection(self):
+        name = self.qt_connection_name()
+        if QtSql.QSqlDatabase.contains(name):
+            return QtSql.QSqlDatabase.database(name)
+
+        # Make sure the schema exists before Qt reads the table records.
+        self.connection()
+        qt_database = QtSql.QSqlDatabase.addDatabase("QSQLITE", name)
+        qt_database.setDatabaseName(self.path)
+        qt_database.setConnectOptions(
+            "QSQLITE_BUSY_TIMEOUT={:d}".format(int(self.busy_timeout * 1000))
+        )
+        qt_database.open()
+        QtSql.QSqlQuery("PRAGMA synchronous = NORMAL", qt_database)
+
+        return qt_database
+
+
+class TodoDatabaseManager(database.TodoDatabase):
+    registry_class = TodoConnectionRegistry
+
+    def __init__(self, registry=None):
+        super(TodoDatabaseManager, self).__init__(registry)
+        self.connection_name = self.registry.connection_name
+
+    def get_connection(self):
+        return self.registry.qt_connection()
+
+
+class TodoModel(QtSql.QSqlTableModel):
+    # Emitted with the ids and the error when a queued write is rolled back.
+    write_failed = QtCore.pyqtSignal(object, str)
+    # Emitted once an asynchronous load has delivered all of its rows.
+    rows_loaded = QtCore.pyqtSignal()
+    row_update_limit = 32
+    # Set in paged mode, where rows come from a keyset paginated store
+    # instead of the QSqlTableModel query.
+    page_store = None
+
+    def __init__(
+            self, priority, lifespans, database_manager=None,
+            paged=False, page_size=None, write_behind=False, async_select=False
+    ):
+        database_manager = database_manager or TodoDatabaseManager()
+        super(TodoModel, self).__init__(None, database_manager.get_connection())
+        self.database_manager = database_manager
+        self.setTable(self.table())
+        self.field_names = self.fields()
+        if paged:
+            self.page_store = database.PageStore(
+                database_manager.registry, priority, page_size
+            )
+        elif async_select:
+            # Rows are loaded by TodoQuery on a pool thread.
+            self.page_store = database.RowStore(priority)
+        self.async_select = async_select and not paged
+        # Paged rows can be evicted and re-read, everything else stays put
+        # until the model signals a change, so its row states are cached.
+        self.cache_rows = not paged
+        self.query_generation = 0
+        self.queries = {}
+        self.query_received = False
         self.priority = priority
         self.active_lifespan, self.completed_lifespan = lifespans
+        self.id_column = self.fieldIndex("id")
         self.title_column = self.fieldIndex("title")
         self.completed_column = self.fieldIndex("completed")
         self.timestamp_column = self.fieldIndex("timestamp")
@@ -443,9 +1021,39 @@ class TodoModel(QtSql.QSqlTableModel):
         self._current_completed_font = None
         self._current_font_color = None
         self._current_completed_font_color = None
+        self.timestamp_cache = utils.TimestampCache()
+        # In write-behind mode edits are shown from {id: {field: value}}
+        # until the writer commits or rolls them back.
+        self.write_behind = TodoWriteBehind.instance() if write_behind else None
+        self.pending_values = {}
+        self.pending_writes = collections.Counter()
+        # Compact per-row (id, completed, priority, timestamp) tuples so role
+        # and flag decisions never go back to the query for them.
+        self._row_states = []
+        self._row_renders = []
+        self.modelReset.connect(self.reset_row_states)
+        self.rowsInserted.connect(
+            lambda parent, first, last: self.reset_row_states(first)
+        )
+        self.rowsRemoved.connect(
+            lambda parent, first, last: self.reset_row_states(first)
+        )
+        self.dataChanged.connect(
+            lambda top_left, bottom_right, roles=None: self.reset_row_states(
+                top_left.row(), bottom_right.row()
+            )
+        )
+        self.rowsMoved.connect(
+            lambda parent, first, last, destination, row: self.reset_row_states(
+                min(first, row)
+            )
+        )
+        self.layoutChanged.connect(lambda *args: self.reset_row_states())
 
         self.setEditStrategy(QtSql.QSqlTableModel.OnFieldChange)
         self.select()
+        TodoChangeBus.instance().changed.connect(self.apply_change)
+        profiler.mark("model:{}".format(priority))
 
     @property
     def current_font(self):
@@ -458,6 +1066,7 @@ class TodoModel(QtSql.QSqlTableModel):
         self._current_completed_font = QtGui.QFont(font)
         self._current_completed_font.setPointSize(self._current_font.pointSize())
         self._current_completed_font.setStrikeOut(True)
+        self._row_renders = []
 
     @property
     def current_font_color(self):
@@ -470,13 +1079,14 @@ class TodoModel(QtSql.QSqlTableModel):
         s *= 0.5
         a *= 0.75
         self._current_completed_font_color = QtGui.QColor.fromHsv(h, s, v, a)
+        self._row_renders = []
 
     def populate_record(self, row, record, role=QtCore.Qt.EditRole):
         for column in range(record.count()):
             field = record.field(column)
             if field.isNull():
                 if column == self.timestamp_column:
-                    value = utils.get_timestamp()
+                    value = database.get_timestamp()
                 else:
                     value = self.data(
                         self.index(row, column), role
@@ -511,10 +1121,557 @@ class TodoModel(QtSql.QSqlTableModel):
 
         return data
 
-    def submit(self):
-        self.datachanged.emit()
+    def notify(self, ids=None, priorities=None, removed=False, applied=False):
+        return TodoChangeBus.instance().publish(
+            ids, priorities or [self.priority], removed,
+            self if applied else None
+        )
+
+    def stored_data(self, index, role=QtCore.Qt.EditRole):
+        if self.page_store is None:
+            return super(TodoModel, self).data(index, role)
+        if role not in (QtCore.Qt.EditRole, QtCore.Qt.DisplayRole):
+            return None
+        values = self.page_store.row(index.row())
+        if values is not None:
+            return values[index.column()]
+
+    def raw_data(self, index, role=QtCore.Qt.EditRole):
+        if self.pending_values and role in (
+                QtCore.Qt.EditRole, QtCore.Qt.DisplayRole
+        ):
+            id = self.stored_data(self.index(index.row(), self.id_column))
+            values = self.pending_values.get(id)
+            if values:
+                field = self.field_names[index.column()]
+                if field in values:
+                    return values[field]
+        return self.stored_data(index, role)
+
+    def read_row_state(self, row):
+        values = [
+            self.raw_data(self.index(row, column))
+            for column in (
+                self.id_column,
+                self.completed_column,
+                self.priority_column,
+                self.timestamp_column,
+            )
+        ]
+        id, completed, priority, timestamp = values
+        return TodoRowState(
+            id,
+            bool(completed),
+            priority,
+            int(timestamp) if timestamp not in (None, "") else None
+        )
+
+    def row_state(self, row):
+        if not self.cache_rows:
+            return self.read_row_state(row)
+
+        if row >= len(self._row_states):
+            self._row_states.extend(
+                [None] * (row + 1 - len(self._row_states))
+            )
+
+        state = self._row_states[row]
+        if state is None:
+            state = self._row_states[row] = self.read_row_state(row)
+        return state
+
+    def row_render(self, row):
+        if row < len(self._row_renders):
+            render = self._row_renders[row]
+            if render is not None:
+                return render
+
+        state = self.row_state(row)
+        completed = state.completed
+        title = self.raw_data(self.index(row, self.title_column))
+        render = TodoRowRender(
+            completed,
+            u"" if title is None else u"{}".format(title),
+            state.timestamp,
+            self._current_completed_font if completed else self._current_font,
+            (
+                self._current_completed_font_color
+                if completed else self._current_font_color
+            )
+        )
+        if self.cache_rows:
+            if row >= len(self._row_renders):
+                self._row_renders.extend(
+                    [None] * (row + 1 - len(self._row_renders))
+                )
+            self._row_renders[row] = render
+        return render
+
+    def build_row_states(self):
+        self._row_states = [
+            self.read_row_state(row) for row in range(self.rowCount())
+        ]
+
+    def reset_row_states(self, first=0, last=None):
+        if last is None:
+            del self._row_states[first:]
+            del self._row_renders[first:]
+            return
+        for row in range(first, min(last + 1, len(self._row_states))):
+            self._row_states[row] = None
+        for row in range(first, min(last + 1, len(self._row_renders))):
+            self._row_renders[row] = None
+
+    def select(self):
+        profiler.once("first_select")
+        if self.async_select:
+            self.start_query()
+            return True
+        if self.page_store is not None:
+            self.beginResetModel()
+            self.page_store.reset()
+            self.page_store.fetch_more()
+            self.endResetModel()
+            if instrument.enabled:
+                instrument.count("rows.fetched", self.page_store.loaded)
+            return True
+
+        result = super(TodoModel, self).select()
+        self.build_row_states()
+        if instrument.enabled:
+            instrument.count("rows.fetched", self.rowCount())
+        return result
+
+    def start_query(self):
+        for query in self.queries.values():
+            query.cancel()
+        self.query_generation += 1
+        self.query_received = False
+        query = TodoQuery(
+            self.database_manager.registry, self.priority, self.query_generation
+        )
+        query.signals.rows_ready.connect(self.receive_rows)
+        query.signals.finished.connect(self.finish_query)
+        # A reload collects every batch and swaps them in at the end, so
+        # the rows on screen don't empty out and the selection survives.
+        query.rows = [] if self.page_store.loaded else None
+        self.queries[self.query_generation] = query
+        query.started = time.perf_counter()
+        query.start()
+
+    def receive_rows(self, generation, rows):
+        if generation != self.query_generation:
+            return
+        if instrument.enabled:
+            instrument.count("rows.fetched", len(rows))
+
+        query = self.queries.get(generation)
+        if query is not None and query.rows is not None:
+            query.rows.extend(rows)
+            return
+
+        if not self.query_received:
+            # The previous rows stay up until the first batch replaces them.
+            self.query_received = True
+            self.beginResetModel()
+            self.page_store.reset()
+            self.page_store.append(rows)
+            self.endResetModel()
+            return
+
+        first = self.page_store.loaded
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(rows) - 1)
+        self.page_store.append(rows)
+        self.endInsertRows()
+
+    def finish_query(self, generation, error):
+        query = self.queries.pop(generation, None)
+        if generation != self.query_generation:
+            return
+        if instrument.enabled and query is not None:
+            instrument.observe(
+                "model.async_select", time.perf_counter() - query.started
+            )
+        if error:
+            print("Loading priority {} failed: {}".format(self.priority, error))
+        elif query is not None and query.rows is not None:
+            self.swap_rows(query.rows)
+        elif not self.query_received:
+            self.query_received = True
+            self.beginResetModel()
+            self.page_store.reset()
+            self.endResetModel()
+        self.rows_loaded.emit()
+
+    def swap_rows(self, rows):
+        """Replace the loaded rows, keeping selections on the same todos.
+
+        The row count only changes through row signals, the content through
+        a layout change that moves persistent indexes along with their ids.
+        """
+        rows = list(rows)
+        loaded = self.page_store.loaded
+        persistent = self.persistentIndexList()
+        ids = [self.id_for_row(index.row()) for index in persistent]
+
+        if len(rows) > loaded:
+            self.beginInsertRows(QtCore.QModelIndex(), loaded, len(rows) - 1)
+            self.page_store.replace(rows)
+            self.endInsertRows()
+
+        self.layoutAboutToBeChanged.emit()
+        # Rows past the new end stay until they are removed below.
+        self.page_store.replace(rows + [
+            self.page_store.row(row) for row in range(len(rows), loaded)
+        ])
+        positions = dict(
+            (values[self.id_column], row) for row, values in enumerate(rows)
+        )
+        self.changePersistentIndexList(persistent, [
+            self.index(positions[id], index.column())
+            if id in positions else QtCore.QModelIndex()
+            for index, id in zip(persistent, ids)
+        ])
+        self.layoutChanged.emit()
+
+        if len(rows) < loaded:
+            self.beginRemoveRows(QtCore.QModelIndex(), len(rows), loaded - 1)
+            self.page_store.replace(rows)
+            self.endRemoveRows()
+
+    def refresh_pages(self):
+        """Re-anchor a paged model after changes it could not place.
+
+        The row count only changes through row signals, the content through
+        a layout change that moves persistent indexes along with their ids.
+        """
+        loaded = self.page_store.loaded
+        persistent = self.persistentIndexList()
+        ids = [self.id_for_row(index.row()) for index in persistent]
+        count = self.page_store.reanchor()
+
+        if count > loaded:
+            self.beginInsertRows(QtCore.QModelIndex(), loaded, count - 1)
+            self.page_store.resize(count)
+            self.endInsertRows()
+
+        self.layoutAboutToBeChanged.emit()
+        positions = {}
+        if len(set(ids)) <= self.row_update_limit:
+            entries = self.database_manager.get_entries(set(ids))
+            for id, values in entries.items():
+                if values[self.priority_column] == self.priority:
+                    row = self.page_store.position(values)
+                    if row < min(count, self.page_store.loaded):
+                        positions[id] = row
+        self.changePersistentIndexList(persistent, [
+            self.index(positions[id], index.column())
+            if id in positions else QtCore.QModelIndex()
+            for index, id in zip(persistent, ids)
+        ])
+        self.layoutChanged.emit()
+
+        if count < loaded:
+            self.beginRemoveRows(QtCore.QModelIndex(), count, loaded - 1)
+            self.page_store.resize(count)
+            self.endRemoveRows()
+
+    def reload_entries(self):
+        if self.async_select:
+            self.select()
+        else:
+            self.refresh_pages()
+
+    def in_window(self, row):
+        return row < self.page_store.loaded or self.page_store.exhausted
+
+    def insert_row(self, row, values):
+        if not self.in_window(row):
+            self.page_store.insert(row, values)
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.page_store.insert(row, values)
+        self.endInsertRows()
+        if not self.page_store.exhausted:
+            # A window not read to the end keeps whole pages.
+            last = self.page_store.loaded - 1
+            self.beginRemoveRows(QtCore.QModelIndex(), last, last)
+            self.page_store.trim()
+            self.endRemoveRows()
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        self.page_store.remove(row)
+        self.endRemoveRows()
+        self.fill_row()
+
+    def fill_row(self):
+        """Take in the next row after one left a window not read to the end."""
+        if not self.page_store.exhausted and self.page_store.has_more():
+            last = self.page_store.loaded
+            self.beginInsertRows(QtCore.QModelIndex(), last, last)
+            self.page_store.grow()
+            self.endInsertRows()
+
+    def move_row(self, row, target, values):
+        """Put a row back into order after an edit to ``values``."""
+        if not self.in_window(target):
+            # Moved past the loaded rows.
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            self.page_store.remove(row)
+            self.page_store.insert(target, values)
+            self.endRemoveRows()
+            self.fill_row()
+            return
+        if target != row:
+            self.beginMoveRows(
+                QtCore.QModelIndex(), row, row, QtCore.QModelIndex(),
+                target + 1 if target > row else target
+            )
+            self.page_store.move(row, target, values)
+            self.endMoveRows()
+        else:
+            self.page_store.move(row, target, values)
+        self.emit_rows_changed([target])
+
+    def patch_entries(self, ids, added=False):
+        """Re-read a few todos into the row store.
+
+        Each one is updated in place or moved into order, inserted if it
+        joined the priority, or removed if it left it. A paged store only
+        knows the rows of its cached pages and where they were: a todo
+        missing from them, unless it was just added, or more than one todo
+        changing places re-anchors the pages instead.
+        """
+        entries = self.database_manager.get_entries(ids)
+        updates, moves = [], []
+        for id in ids:
+            row = self.page_store.find(id)
+            values = entries.get(id)
+            if values is not None and (
+                    values[self.priority_column] != self.priority
+            ):
+                values = None
+            if row is None:
+                if values is None:
+                    continue
+                if self.page_store.partial_index and not added:
+                    self.refresh_pages()
+                    return
+                moves.append((id, values))
+            elif values is not None and self.page_store.key(
+                    values
+            ) == self.page_store.key(self.page_store.row(row)):
+                updates.append((row, values))
+            else:
+                moves.append((id, values))
+
+        if self.page_store.partial_index and len(moves) > 1:
+            self.refresh_pages()
+            return
+
+        for row, values in updates:
+            self.page_store.update(row, values)
+        self.emit_rows_changed([row for row, values in updates])
+        for id, values in moves:
+            row = self.page_store.find(id)
+            if values is None:
+                self.remove_row(row)
+            elif row is None:
+                self.insert_row(self.page_store.position(values), values)
+            else:
+                self.move_row(
+                    row, self.page_store.position(values, row), values
+                )
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if self.page_store is None:
+            return super(TodoModel, self).rowCount(parent)
+        return 0 if parent.isValid() else self.page_store.loaded
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if self.page_store is None:
+            return super(TodoModel, self).columnCount(parent)
+        return 0 if parent.isValid() else len(self.page_store.columns)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if self.page_store is None:
+            return super(TodoModel, self).canFetchMore(parent)
+        return not parent.isValid() and not self.page_store.exhausted
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if self.page_store is None:
+            if not instrument.enabled:
+                return super(TodoModel, self).fetchMore(parent)
+            loaded = self.rowCount()
+            super(TodoModel, self).fetchMore(parent)
+            instrument.count("rows.fetched", self.rowCount() - loaded)
+            return
+
+        rows = self.page_store.read_next()
+        if instrument.enabled:
+            instrument.count("rows.fetched", len(rows))
+        if not rows:
+            self.page_store.append(rows)
+            return
+
+        first = self.page_store.loaded
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(rows) - 1)
+        self.page_store.append(rows)
+        self.endInsertRows()
+
+    def id_for_row(self, row):
+        return self.row_state(row).id
+
+    def rows_for_ids(self, ids):
+        rows = {}
+        if self.page_store is not None:
+            for id in ids:
+                row = self.page_store.find(id)
+                if row is not None:
+                    rows[id] = row
+            return rows
+        for row in range(self.rowCount()):
+            id = self.id_for_row(row)
+            if id in ids:
+                rows[id] = row
+        return rows
+
+    def load_row(self, id):
+        """Return the row of a todo, fetching the pages up to it if needed.
+
+        A todo past the loaded pages is placed by its key, and pages are
+        fetched until the window reaches it.
+        """
+        row = self.rows_for_ids(set([id])).get(id)
+        if row is not None or self.page_store is None:
+            return row
+        if not self.page_store.partial_index:
+            return None
+
+        values = self.database_manager.get_entries([id]).get(id)
+        if values is None or values[self.priority_column] != self.priority:
+            return None
+        row = self.page_store.position(values)
+        while row >= self.page_store.loaded and self.canFetchMore():
+            self.fetchMore()
+            row = self.page_store.position(values)
+        if row < self.page_store.loaded:
+            return row
+
+    def update_entries(self, ids, changes):
+        ids = list(ids)
+        if not ids:
+            return False
+        if self.write_behind is not None:
+            return self.queue_write(ids, changes)
+
+        result = self.database_manager.update_entries(ids, changes)
+        if result:
+            self.notify(
+                ids, [self.priority, changes.get("priority", self.priority)]
+            )
+        return result
+
+    def emit_rows_changed(self, rows):
+        if rows:
+            self.dataChanged.emit(
+                self.index(min(rows), 0),
+                self.index(max(rows), self.columnCount() - 1)
+            )
+
+    def queue_write(self, ids, changes, rows=None):
+        for id in ids:
+            self.pending_values.setdefault(id, {}).update(changes)
+            self.pending_writes[id] += 1
+        self.write_behind.submit(TodoWrite(ids, changes, self))
+        if rows is None:
+            rows = self.rows_for_ids(set(ids)).values()
+        self.emit_rows_changed(list(rows))
         return True
 
+    def refresh_entries(self, ids, fields):
+        ids = set(ids)
+        if self.page_store is not None:
+            if len(ids) > self.row_update_limit:
+                self.reload_entries()
+            else:
+                self.patch_entries(ids)
+            return
+
+        if "priority" in fields or len(ids) > self.row_update_limit:
+            self.select()
+            return
+
+        for row in self.rows_for_ids(ids).values():
+            self.selectRow(row)
+
+    def release_pending(self, ids):
+        for id in ids:
+            self.pending_writes[id] -= 1
+            if self.pending_writes[id] <= 0:
+                del self.pending_writes[id]
+                self.pending_values.pop(id, None)
+
+    def finish_write(self, write):
+        self.release_pending(write.ids)
+        self.refresh_entries(write.ids, write.changes)
+        self.notify(
+            write.ids,
+            [self.priority, write.changes.get("priority", self.priority)],
+            applied=True
+        )
+
+    def roll_back_write(self, write, error):
+        print("Write of {} to {} failed: {}".format(
+            write.changes, list(write.ids), error
+        ))
+        self.release_pending(write.ids)
+        # Later writes to the same ids may still be queued, but what is
+        # shown has to match the database again right away.
+        for id in write.ids:
+            self.pending_values.pop(id, None)
+        self.refresh_entries(write.ids, write.changes)
+        self.write_failed.emit(list(write.ids), error)
+
+    def mark_entries(self, ids, completed):
+        return self.update_entries(ids, {"completed": int(bool(completed))})
+
+    def move_entries(self, ids, priority):
+        return self.update_entries(ids, {"priority": priority})
+
+    def apply_change(self, change):
+        if change.source is self or not change.affects(self.priority):
+            return
+
+        if self.page_store is not None:
+            if (
+                    change.ids
+                    and len(change.ids) <= self.row_update_limit
+                    and not change.removed
+            ):
+                self.patch_entries(change.ids)
+            else:
+                self.reload_entries()
+            return
+
+        # A few rows edited in place are re-read one by one, anything that
+        # adds, moves or removes rows, or touches many of them, needs a new
+        # select.
+        if (
+                change.ids
+                and len(change.ids) <= self.row_update_limit
+                and not change.removed
+                and change.priorities == frozenset([self.priority])
+        ):
+            rows = self.rows_for_ids(change.ids)
+            if len(rows) == len(change.ids):
+                for row in rows.values():
+                    self.selectRow(row)
+                return
+
+        self.select()
+
     def print_record(self, record, prefix=None):
         if record.isEmpty():
             print("Empty record. Nothing to print.")
@@ -541,7 +1698,7 @@ class TodoModel(QtSql.QSqlTableModel):
 
     def selectStatement(self):
         return """
-            SELECT {} from {} WHERE priority = {} ORDER BY completed 
+            SELECT {} from {} WHERE priority = {} ORDER BY completed, timestamp, id
         """.format(
             ", ".join(self.fields()),
             self.table(),
@@ -568,27 +1725,26 @@ class TodoModel(QtSql.QSqlTableModel):
         return record
 
     def add_entry(self, data_dict):
-        print("Adding entry in {}: {}".format(self.priority, data_dict))
-        record = self.generate_record(data_dict)
-        return self.insertRecord(-1, record)
+        instrument.count("model.add_entry")
+        if self.page_store is not None:
+            data = dict(self.default_values, **data_dict)
+            data.pop("id")
+            result = self.database_manager.add_entry(data)
+            if result:
+                self.patch_entries([result], added=True)
+                # Published with its id, so models insert just this row.
+                self.notify([result], applied=True)
+            return result
 
-    def insertRecord(self, row, record):
-        print("insertRecord()")
-        return super(TodoModel, self).insertRecord(row, record)
-
-    def setRecord(self, row, record):
-        print("setRecord()")
-        return super(TodoModel, self).setRecord(row, record)
+        record = self.generate_record(data_dict)
+        result = self.insertRecord(-1, record)
+        if result:
+            self.notify(applied=True)
+        return result
 
     def flags(self, index):
         if index.column() == self.title_column:
-            completed = bool(
-                self.data(
-                    self.index(index.row(), self.completed_column),
-                    QtCore.Qt.EditRole
-                )
-            )
-            if not completed:
+            if not self.row_state(index.row()).completed:
                 return (
                         QtCore.Qt.ItemIsEditable
                         | QtCore.Qt.ItemIsEnabled
@@ -604,103 +1760,45 @@ class TodoModel(QtSql.QSqlTableModel):
 
         return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
 
-    def get_age(self, timestamp_index):
-        value = str(self.data(timestamp_index, QtCore.Qt.EditRole))
-        if not value:
-            return 0
-
-        return (
-                utils.get_date(utils.get_timestamp())
-                - utils.get_date(value)
-        ).seconds
-
     def get_record(self, row):
         return self.populate_record(row, self.generate_record())
 
-    def process_demotion(self, timestamp_index):
-        if self.active_lifespan is None:
-            return
-
-        if self.get_age(timestamp_index) > self.active_lifespan:
-            record = self.get_record(timestamp_index.row())
-            value, _ = record.value(self.priority_column).toInt()
-            record.setValue(
-                self.priority_column,
-                value + 1
-            )
-            self.updateRowInTable(timestamp_index.row, record)
-            self.submit()
-
-    def process_deletion(self, timestamp_index):
-        if self.completed_lifespan is None:
-            return
-
-        if self.get_age(timestamp_index) > self.completed_lifespan:
-            record = self.get_record(timestamp_index.row())
-            self.deleteRowFromTable(record)
-            self.submit()
-
-    def process_lifespans(self, timestamp_index):
-        completed = bool(
-            super(TodoModel, self).data(
-                self.index(timestamp_index.row(), self.completed_column),
-                QtCore.Qt.EditRole
-            )
-        )
-
-        if completed:
-            self.process_deletion(timestamp_index)
-        else:
-            self.process_demotion(timestamp_index)
-
     def data(self, index, role):
         if not index.isValid():
-            print("Invalid index.")
             return None
 
         column = index.column()
-        value = super(TodoModel, self).data(index, role)
-
-        if role == QtCore.Qt.CheckStateRole:
-            if column != self.completed_column:
-                return None
-            completed = bool(
-                super(TodoModel, self).data(
-                    index, QtCore.Qt.EditRole
-                )
-            )
-            return QtCore.Qt.Checked if completed else QtCore.Qt.Unchecked
 
         if role == QtCore.Qt.EditRole:
-            return value
+            return self.raw_data(index, role)
 
         if role == QtCore.Qt.DisplayRole:
             if column == self.completed_column:
                 return None
             if column == self.timestamp_column:
-                self.process_lifespans(index)
-                str_value = str(value)
-                if str_value:
-                    return utils.get_date(str_value).humanize()
+                timestamp = self.row_state(index.row()).timestamp
+                if timestamp is not None:
+                    return self.timestamp_cache.humanize(timestamp)
 
-            return value
+            return self.raw_data(index, role)
 
-        completed = bool(
-            super(TodoModel, self).data(
-                self.index(index.row(), self.completed_column), QtCore.Qt.EditRole
-            )
-        )
+        completed = self.row_state(index.row()).completed
+
+        if role == QtCore.Qt.CheckStateRole:
+            if column != self.completed_column:
+                return None
+            return QtCore.Qt.Checked if completed else QtCore.Qt.Unchecked
 
         if role == QtCore.Qt.ToolTipRole:
             if column == self.timestamp_column:
-                value = super(TodoModel, self).data(
-                    index, QtCore.Qt.DisplayRole
-                )
-                return utils.get_formatted_date(str(value))
+                timestamp = self.row_state(index.row()).timestamp
+                if timestamp is not None:
+                    return self.timestamp_cache.format(timestamp)
+                return None
             if column == self.completed_column:
                 return "Completed" if completed else "Active"
 
-            return value
+            return self.raw_data(index, role)
 
         if role == QtCore.Qt.TextAlignmentRole:
             if column == self.completed_column:
@@ -720,7 +1818,53 @@ class TodoModel(QtSql.QSqlTableModel):
                 if completed else self._current_font_color
             )
 
+    def set_paged_data(self, index, value, role):
+        column = index.column()
+        if role == QtCore.Qt.CheckStateRole:
+            if column != self.completed_column:
+                return None
+            value = 1 if value == QtCore.Qt.Checked else 0
+        elif role != QtCore.Qt.EditRole:
+            return False
+
+        row = index.row()
+        values = list(self.page_store.row(row))
+        id = values[self.id_column]
+        field = self.page_store.columns[column]
+        result = self.database_manager.update_entries([id], {field: value})
+        if result:
+            values[column] = value
+            target = row
+            if field in self.page_store.order:
+                target = self.page_store.position(values, row)
+            self.move_row(row, target, values)
+            self.notify([id], applied=True)
+
+        return result
+
+    def queue_data(self, index, value, role):
+        column = index.column()
+        if role == QtCore.Qt.CheckStateRole:
+            if column != self.completed_column:
+                return False
+            value = 1 if value == QtCore.Qt.Checked else 0
+        elif role != QtCore.Qt.EditRole:
+            return False
+
+        id = self.id_for_row(index.row())
+        return self.queue_write(
+            [id], {self.field_names[column]: value}, [index.row()]
+        )
+
     def setData(self, index, value, role):
+        if index.column() == self.timestamp_column:
+            self.timestamp_cache.invalidate(self.raw_data(index))
+        if self.write_behind is not None:
+            return self.queue_data(index, value, role)
+        if self.page_store is not None:
+            return self.set_paged_data(index, value, role)
+
+        id = self.id_for_row(index.row())
         if role == QtCore.Qt.CheckStateRole:
             if index.column() != self.completed_column:
                 return None
@@ -728,17 +1872,16 @@ class TodoModel(QtSql.QSqlTableModel):
                 result = super(TodoModel, self).setData(
                     index, 1, QtCore.Qt.EditRole
                 )
-                print("1. Result: {}, Value: {}".format(result, value))
             else:
                 result = super(TodoModel, self).setData(
                     index, 0, QtCore.Qt.EditRole
                 )
-                print("2. Result: {}, Value: {}".format(result, value))
         else:
             result = super(TodoModel, self).setData(index, value, role)
-            print("3. Result: {}, Value: {}".format(result, value))
 
-        if not result:
+        if result:
+            self.notify([id], applied=True)
+        else:
             self.print_last_error("setData()")
 
         return result
@@ -757,3 +1900,31 @@ class TodoModel(QtSql.QSqlTableModel):
             )
         )
 
+
+ROLE_NAMES = dict(
+    (getattr(QtCore.Qt, name), name) for name in (
+        "DisplayRole", "DecorationRole", "EditRole", "ToolTipRole",
+        "StatusTipRole", "WhatsThisRole", "FontRole", "TextAlignmentRole",
+        "BackgroundRole", "ForegroundRole", "CheckStateRole", "SizeHintRole",
+        "AccessibleTextRole", "AccessibleDescriptionRole",
+    )
+)
+
+
+def install_instrumentation():
+    """Time the model and delegate hot paths; see todo.instrument."""
+    instrument.wrap(
+        TodoModel,
+        "data",
+        lambda model, index, role: "model.data.{}".format(
+            ROLE_NAMES.get(role, role)
+        )
+    )
+    instrument.wrap(TodoModel, "flags", "model.flags")
+    instrument.wrap(TodoModel, "select", "model.select")
+    instrument.wrap(TodoModel, "setData", "model.setData")
+    instrument.wrap(TodoItemDelegate, "paint", "delegate.paint")
+
+
+if instrument.enabled:
+    install_instrumentation()
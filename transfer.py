@@ -0,0 +1,159 @@
+"""Streaming import and export of todos as JSONL or CSV.
+
+Imports go through a generator pipeline and are inserted in chunks with
+executemany, one transaction per chunk; exports stream straight from a
+cursor. Neither side ever holds more than one chunk in memory.
+"""
+import csv
+import itertools
+import json
+
+from todo import constant, database
+
+FORMATS = ("jsonl", "csv")
+COLUMNS = ("id", "completed", "title", "timestamp", "priority")
+BATCH_SIZE = 10000
+
+TRUE_VALUES = ("1", "true", "yes", "y", "x", "done", "completed")
+FALSE_VALUES = ("", "0", "false", "no", "n", "active")
+
+
+class TransferError(ValueError):
+    pass
+
+
+def guess_format(path, default="jsonl"):
+    extension = str(path).rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return "csv"
+    if extension in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    return default
+
+
+PRIORITY_NAMES = dict(
+    (name, priority)
+    for priority, label in constant.PRIORITIES.items()
+    for name in (str(priority), label.lower())
+)
+
+
+def get_priority(value):
+    if value in constant.PRIORITIES:
+        return value
+    return PRIORITY_NAMES.get(str(value).strip().lower())
+
+
+def get_completed(value):
+    if isinstance(value, (bool, int)):
+        return int(bool(value))
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return 1
+    if text in FALSE_VALUES:
+        return 0
+    raise ValueError("invalid completed value: {!r}".format(value))
+
+
+def read_jsonl(source):
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as error:
+            raise TransferError("line {}: {}".format(number, error))
+        yield number, entry
+
+
+def read_csv(source):
+    # The header is line 1.
+    for number, entry in enumerate(csv.DictReader(source), 2):
+        yield number, entry
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+def normalize(entries, timestamp=None):
+    """Turn (line number, dict) pairs into rows in database.FIELDS order."""
+    timestamp = timestamp or database.get_timestamp()
+    for number, entry in entries:
+        try:
+            title = entry["title"]
+            if not title:
+                raise ValueError("empty title")
+            completed = get_completed(entry.get("completed") or 0)
+            priority = get_priority(entry.get("priority") or 1)
+            if priority is None:
+                raise ValueError(
+                    "invalid priority: {!r}".format(entry.get("priority"))
+                )
+            created = int(float(entry.get("timestamp") or timestamp))
+        except (KeyError, TypeError, ValueError, AttributeError) as error:
+            raise TransferError("line {}: {}".format(number, error))
+
+        yield completed, title, created, priority
+
+
+def insert_rows(connection, rows, batch_size=None):
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size or BATCH_SIZE))
+        if not batch:
+            break
+        with database.transaction(connection):
+            count += database.insert_rows(connection, batch)
+    return count
+
+
+def import_entries(todo_database, source, format="jsonl", batch_size=None):
+    """Import todos from an open file and return how many were added.
+
+    Ids in the source are ignored, every entry becomes a new todo. Chunks
+    committed before a malformed line stay imported.
+    """
+    if format not in READERS:
+        raise TransferError("unknown format: {!r}".format(format))
+    rows = normalize(READERS[format](source))
+    return insert_rows(todo_database.connection, rows, batch_size)
+
+
+def write_jsonl(target, rows):
+    for id, completed, title, timestamp, priority in rows:
+        target.write(json.dumps({
+            "id": id,
+            "completed": bool(completed),
+            "title": title,
+            "timestamp": timestamp,
+            "priority": priority,
+        }) + "\n")
+
+
+def write_csv(target, rows):
+    csv.writer(target).writerows(rows)
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv}
+
+
+def export_entries(
+        todo_database, target, format="jsonl", priority=None, completed=None,
+        batch_size=None
+):
+    """Write todos to an open file and return how many were written."""
+    if format not in WRITERS:
+        raise TransferError("unknown format: {!r}".format(format))
+
+    write = WRITERS[format]
+    if format == "csv":
+        csv.writer(target).writerow(COLUMNS)
+    count = 0
+    for batch in todo_database.iter_entries(
+            priority, completed, batch_size or BATCH_SIZE
+    ):
+        write(target, batch)
+        count += len(batch)
+    return count
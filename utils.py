@@ -1,12 +1,14 @@
-import todo
-import arrow
-
+import os
+import tempfile
+import time
 
-def get_timestamp():
-    return arrow.now().timestamp
+import todo
 
 
+# arrow is imported on first use, it is only needed once something renders
+# a date and is comparatively slow to import.
 def get_date(timestamp):
+    import arrow
     return arrow.Arrow.fromtimestamp(timestamp)
 
 
@@ -14,3 +16,84 @@ def get_formatted_date(timestamp):
     return get_date(timestamp).format(
         "dddd, Do MMMM YYYY, hh:mm a (ZZZ)"
     )
+
+
+def atomic_write(path, data):
+    """Replace ``path`` with ``data`` so readers never see a partial file.
+
+    The data goes to a temporary file in the same directory, is synced to
+    disk and then renamed over the target.
+    """
+    directory = os.path.dirname(path) or "."
+    descriptor, temporary_path = tempfile.mkstemp(
+        prefix=".{}.".format(os.path.basename(path)), dir=directory
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as temporary:
+            temporary.write(data)
+            temporary.flush()
+            os.fsync(temporary.fileno())
+        os.replace(temporary_path, path)
+    except Exception:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):
+        directory_descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+
+class TimestampCache(object):
+    """Memoizes humanized and formatted renderings of timestamps.
+
+    Humanized strings drift with the clock, so they expire after ``tick``
+    seconds, or ``short_tick`` for timestamps younger than ``recent`` where
+    arrow switches buckets faster. Formatted dates never change and are only
+    dropped when the cache grows past ``size`` entries.
+    """
+
+    def __init__(self, tick=None, short_tick=None, recent=None, size=None):
+        super(TimestampCache, self).__init__()
+        self.tick = tick or 60
+        self.short_tick = short_tick or 10
+        self.recent = recent or 90
+        self.size = size or 4096
+        self._humanized = {}
+        self._formatted = {}
+
+    def humanize(self, timestamp):
+        now = time.time()
+        entry = self._humanized.get(timestamp)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        if len(self._humanized) >= self.size:
+            self._humanized.clear()
+
+        text = get_date(timestamp).humanize()
+        if abs(now - timestamp) < self.recent:
+            expires = now + self.short_tick
+        else:
+            expires = now + self.tick
+        self._humanized[timestamp] = (text, expires)
+        return text
+
+    def format(self, timestamp):
+        text = self._formatted.get(timestamp)
+        if text is None:
+            if len(self._formatted) >= self.size:
+                self._formatted.clear()
+            text = self._formatted[timestamp] = get_formatted_date(timestamp)
+        return text
+
+    def invalidate(self, timestamp=None):
+        if timestamp is None:
+            self._humanized.clear()
+            self._formatted.clear()
+        else:
+            self._humanized.pop(timestamp, None)
+            self._formatted.pop(timestamp, None)